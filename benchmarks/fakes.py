@@ -0,0 +1,137 @@
+# benchmarks/fakes.py
+"""Lightweight stand-ins for the discord.py objects the bot touches."""
+import itertools
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import List, Optional
+
+from discord_llm_chatbot.bot.bot import MyBot
+from discord_llm_chatbot.config.config import Config
+
+ids = itertools.count(10**17)
+
+
+class FakeUser:
+    def __init__(self, name: str, bot: bool = False):
+        self.id = next(ids)
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+
+    def __str__(self) -> str:
+        return self.name
+
+    def mentioned_in(self, message: "FakeMessage") -> bool:
+        return self in message.mentions
+
+
+class FakeAttachment:
+    def __init__(
+        self,
+        url: str,
+        content_type: str = "image/png",
+        size: int = 0,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+    ):
+        self.url = url
+        self.content_type = content_type
+        self.size = size
+        self.width = width
+        self.height = height
+
+
+class FakeSentMessage:
+    def __init__(self, channel: "FakeChannel", content: str):
+        self.id = next(ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content: str):
+        self.content = content
+
+    async def delete(self):
+        pass
+
+
+class FakeChannel:
+    def __init__(self, name: str = "general"):
+        self.id = next(ids)
+        self.name = name
+        self.sent: List[FakeSentMessage] = []
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, content: str, **kwargs) -> FakeSentMessage:
+        sent = FakeSentMessage(self, content)
+        self.sent.append(sent)
+        return sent
+
+    async def typing(self):
+        pass
+
+
+class FakeReference:
+    def __init__(self, resolved: Optional["FakeMessage"]):
+        self.resolved = resolved
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        channel: FakeChannel,
+        author: FakeUser,
+        content: str,
+        attachments: Optional[List[FakeAttachment]] = None,
+        mentions: Optional[List[FakeUser]] = None,
+        reference: Optional[FakeReference] = None,
+    ):
+        self.id = next(ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.attachments = attachments or []
+        self.mentions = mentions or []
+        self.reference = reference
+        self.guild = None
+        self.created_at = datetime.now(timezone.utc)
+
+
+def make_config(**overrides) -> Config:
+    """Returns a config that needs no environment or network access."""
+    settings = dict(
+        DISCORD_TOKEN="",
+        OPENAI_API_KEY="benchmark",
+        DESIGNATED_CHANNELS=[],
+        GUILD_TEST_ID="",
+        OWNER_ID="",
+        LOCAL_CLIENT_URL="",
+        MODEL_NAME="",
+    )
+    settings.update(overrides)
+    return Config(**settings)
+
+
+async def make_bot(config: Optional[Config] = None) -> MyBot:
+    """Builds a bot that is logged in as a fake user without connecting."""
+    bot = MyBot(config or make_config())
+    # Creates the loop-bound state that `start` would, so `close` works
+    await bot._async_setup_hook()
+    bot._connection.user = FakeUser("Vivi", bot=True)
+
+    # Image checks would hit the network; treat every fake URL as valid.
+    async def validate(urls: List[str]) -> List[str]:
+        return urls
+
+    bot.image_validator.validate = validate
+    # Downloading and downscaling would too; images are sent as plain URLs.
+    bot.image_processor = None
+
+    # Fake messages can't build a real command context; none are commands.
+    async def get_context(message, *, cls=None) -> SimpleNamespace:
+        return SimpleNamespace(valid=False)
+
+    bot.get_context = get_context
+    return bot
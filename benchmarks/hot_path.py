@@ -0,0 +1,307 @@
+# benchmarks/hot_path.py
+"""Micro-benchmarks for the per-message hot path.
+
+Runs entirely offline against fake Discord objects:
+
+    python -m benchmarks.hot_path --output results.json
+    python -m benchmarks.hot_path --compare results.json --threshold 1.25
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from discord_llm_chatbot.bot.conversation_store import CachedMessage, ChannelHistory
+from discord_llm_chatbot.bot.triggers import TriggerEngine
+from discord_llm_chatbot.utils.text_processor import ResponseCleaner, TextProcessor
+
+from .fakes import (
+    FakeAttachment,
+    FakeChannel,
+    FakeMessage,
+    FakeUser,
+    make_bot,
+    make_config,
+)
+
+HISTORY_SIZES = [10, 100, 1000]
+IMAGES_PER_MESSAGE = 2
+
+SHORT_REPLY = "lmao no way. pineapple on pizza is a crime and I will die on this hill!"
+LONG_REPLY = " ".join([SHORT_REPLY] * 40)
+STRUCTURED_REPLY = (
+    "<|start|>\nauthor: Vivi\nmessage: " + LONG_REPLY + "\nreply_to: null\n<|end|>"
+)
+FALLBACK_REPLY = LONG_REPLY + ' - sent by "Vivi#5153": whatever\nReplying to someone'
+# Roughly the size of a streamed completion delta
+DELTA_CHARS = 16
+KEYWORD_COUNTS = [10, 1000]
+
+
+class Bench:
+    """Times repeated calls of one case for at least `min_time` seconds."""
+
+    def __init__(self, min_time: float, min_rounds: int):
+        self.min_time = min_time
+        self.min_rounds = min_rounds
+        self.results: List[Dict[str, Any]] = []
+
+    async def run(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        call: Callable[[], Awaitable[None]],
+        reset: Optional[Callable[[], None]] = None,
+    ):
+        samples: List[float] = []
+        deadline = time.perf_counter() + self.min_time
+        while len(samples) < self.min_rounds or time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - start)
+            if reset:
+                reset()
+
+        samples.sort()
+        result = {
+            "name": name,
+            "params": params,
+            "rounds": len(samples),
+            "mean_us": statistics.fmean(samples) * 1e6,
+            "median_us": statistics.median(samples) * 1e6,
+            "p95_us": samples[int(len(samples) * 0.95) - 1] * 1e6,
+        }
+        self.results.append(result)
+        print(
+            f"{case_key(result):<55} median {result['median_us']:>10.1f} us"
+            f"  p95 {result['p95_us']:>10.1f} us",
+            file=sys.stderr,
+        )
+
+
+def case_key(result: Dict[str, Any]) -> str:
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def make_message(
+    channel: FakeChannel, author: FakeUser, index: int, images: bool
+) -> FakeMessage:
+    attachments = (
+        [
+            FakeAttachment(f"https://cdn.example.com/{channel.id}/{index}/{i}.png")
+            for i in range(IMAGES_PER_MESSAGE)
+        ]
+        if images
+        else []
+    )
+    content = f"message number {index} " + SHORT_REPLY
+    return FakeMessage(channel, author, content, attachments)
+
+
+async def make_history_bot():
+    """Builds a bot whose history caps never evict, so each size is kept."""
+    return await make_bot(
+        make_config(
+            CHANNEL_TOKEN_LIMIT=0, CHANNEL_MESSAGE_LIMIT=0, CACHE_MEMORY_BUDGET=0
+        )
+    )
+
+
+async def fill(bot, channel: FakeChannel, author: FakeUser, size: int, images: bool):
+    for i in range(size):
+        message = make_message(channel, author, i, images)
+        await bot.message_handler.handle_regular_message(message, channel.id, False)
+    history = bot.cache.get(channel.id)
+    assert len(history) == size, f"history holds {len(history)} of {size} messages"
+    return history
+
+
+async def bench_handler(bench: Bench, size: int, images: bool):
+    bot = await make_history_bot()
+    channel, author = FakeChannel(), FakeUser("user")
+    history = await fill(bot, channel, author, size, images)
+    incoming = [make_message(channel, author, size + i, images) for i in range(256)]
+    counter = iter(range(10**9))
+
+    async def call():
+        message = incoming[next(counter) % len(incoming)]
+        await bot.message_handler.handle_regular_message(message, channel.id, False)
+
+    await bench.run(
+        "handle_regular_message",
+        {"history": size, "images": images},
+        call,
+        history.popleft,
+    )
+    await bot.close()
+
+
+async def bench_trim_images(bench: Bench, size: int, images: bool):
+    bot = await make_history_bot()
+    channel, author = FakeChannel(), FakeUser("user")
+    history: ChannelHistory = await fill(bot, channel, author, size, images)
+    max_images = bot.config.MAX_CACHED_IMAGES
+    message = make_message(channel, author, size, True)
+
+    def reset():
+        history.popleft()
+        history.append(
+            CachedMessage(
+                message.created_at,
+                author.id,
+                author.display_name,
+                message.content,
+                image_urls=[a.url for a in message.attachments],
+            )
+        )
+
+    async def call():
+        history.trim_images(max_images)
+
+    reset()
+    await bench.run("trim_images", {"history": size, "images": images}, call, reset)
+    await bot.close()
+
+
+async def bench_prepare(bench: Bench, size: int, images: bool):
+    bot = await make_history_bot()
+    handler = bot.message_handler
+    channel, author = FakeChannel(), FakeUser("user")
+    await fill(bot, channel, author, size, images)
+    message = make_message(channel, author, size, images)
+
+    async def call():
+        handler.prepare_messages(channel.id, handler.prepare_current_message(message))
+
+    await bench.run("prepare_messages", {"history": size, "images": images}, call)
+    await bot.close()
+
+
+async def bench_text(bench: Bench):
+    processor = TextProcessor()
+    for label, text in [
+        ("short", SHORT_REPLY),
+        ("structured", STRUCTURED_REPLY),
+        ("fallback", FALLBACK_REPLY),
+    ]:
+
+        async def process(text=text):
+            processor.process_response_text(text)
+
+        await bench.run("process_response_text", {"text": label}, process)
+
+    for label, text in [("structured", STRUCTURED_REPLY), ("fallback", FALLBACK_REPLY)]:
+        deltas = [text[i : i + DELTA_CHARS] for i in range(0, len(text), DELTA_CHARS)]
+
+        async def clean_stream(deltas=deltas):
+            cleaner = ResponseCleaner()
+            for delta in deltas:
+                cleaner.feed(delta)
+            cleaner.finish()
+
+        await bench.run("response_cleaner", {"text": label}, clean_stream)
+
+    for label, text in [("short", SHORT_REPLY), ("long", LONG_REPLY)]:
+        for mode, content in [("smiley", "hello"), ("uwu", "uwu please")]:
+
+            async def uwuify(text=text, content=content):
+                processor.uwuify_text(text, content, True)
+
+            await bench.run("uwuify_text", {"text": label, "mode": mode}, uwuify)
+
+
+async def bench_triggers(bench: Bench):
+    rng = random.Random(0)
+    for count in KEYWORD_COUNTS:
+        # Made-up words, so the whole message is scanned without a match
+        keywords = [
+            "".join(rng.choice("bcdfgjkqvxz") for _ in range(6)) for _ in range(count)
+        ]
+        triggers = TriggerEngine({}, keywords, {}, [1])
+
+        async def match(triggers=triggers):
+            triggers.has_keyword(1, LONG_REPLY)
+
+        await bench.run("trigger_match", {"keywords": count}, match)
+
+
+async def run_all(bench: Bench):
+    for size in HISTORY_SIZES:
+        for images in (False, True):
+            await bench_handler(bench, size, images)
+            await bench_trim_images(bench, size, images)
+            await bench_prepare(bench, size, images)
+    await bench_text(bench)
+    await bench_triggers(bench)
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float
+) -> List[str]:
+    """Returns a description of every case slower than `threshold` x baseline."""
+    previous = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        ratio = result["median_us"] / before["median_us"]
+        if ratio > threshold:
+            regressions.append(
+                f"{case_key(result)}: {before['median_us']:.1f} us -> "
+                f"{result['median_us']:.1f} us ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to check against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio of the median that counts as a regression",
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--min-rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    bench = Bench(args.min_time, args.min_rounds)
+    # Keep any stray output from the bot out of the JSON report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run_all(bench))
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": bench.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(bench.results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
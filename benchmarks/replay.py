@@ -0,0 +1,400 @@
+# benchmarks/replay.py
+"""Replays recorded or generated channel traffic through the bot under load.
+
+Messages go through `MyBot.on_message` on fake Discord channels, and replies
+are generated by a local stub LLM server:
+
+    python -m benchmarks.replay generate traffic.jsonl --channels 20 --messages 2000
+    python -m benchmarks.replay run traffic.jsonl --speed 10 --latency 0.5
+
+Record real traffic by setting TRAFFIC_RECORD_PATH on a running bot.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import random
+import resource
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from discord_llm_chatbot.config.config import Config
+from discord_llm_chatbot.utils.traffic_recorder import BOT_MENTION
+
+from .fakes import (
+    FakeAttachment,
+    FakeChannel,
+    FakeMessage,
+    FakeReference,
+    FakeUser,
+    make_bot,
+    make_config,
+)
+from .stub_llm import StubLLM
+
+# How often the sampler measures event loop lag and cache memory
+SAMPLE_INTERVAL = 0.01
+
+
+def generate(
+    path: str,
+    channels: int,
+    messages: int,
+    duration: float,
+    mention_rate: float,
+    reply_rate: float,
+    image_rate: float,
+    seed: Optional[int],
+):
+    """Writes synthetic traffic in the recorder's format.
+
+    A few channels carry most messages, and messages arrive in bursts.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(channels)]
+    authors = {
+        channel: [rng.getrandbits(56) for _ in range(8)] for channel in range(channels)
+    }
+    last_id: Dict[int, int] = {}
+    now = time.time()
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(messages):
+            # Bursty arrivals: mostly short gaps with occasional long pauses
+            now += rng.expovariate(messages / duration) * rng.choice((0.2, 0.2, 2.6))
+            channel = rng.choices(range(channels), weights)[0]
+            words = ["x" * rng.randint(1, 9) for _ in range(rng.randint(3, 40))]
+            mentions_bot = rng.random() < mention_rate
+            if mentions_bot:
+                words.insert(0, BOT_MENTION)
+            entry = {
+                "time": now,
+                "id": rng.getrandbits(56),
+                "channel": channel,
+                "designated": True,
+                "author": rng.choice(authors[channel]),
+                "author_bot": False,
+                "content": " ".join(words),
+                "mentions_bot": mentions_bot,
+                "reply_to": (
+                    last_id.get(channel) if rng.random() < reply_rate else None
+                ),
+                "attachments": (
+                    [
+                        {
+                            "content_type": "image/png",
+                            "size": rng.randint(50_000, 3_000_000),
+                            "width": 1920,
+                            "height": 1080,
+                        }
+                    ]
+                    if rng.random() < image_rate
+                    else []
+                ),
+            }
+            last_id[channel] = entry["id"]
+            f.write(json.dumps(entry) + "\n")
+
+
+def parse_override(config: Config, setting: str) -> Tuple[str, Any]:
+    """Parses a KEY=VALUE config override, converting it to the field's type."""
+    name, _, value = setting.partition("=")
+    current = getattr(config, name)
+    if isinstance(current, bool):
+        return name, value.lower() in ("1", "true", "yes")
+    if isinstance(current, (int, float, str)):
+        return name, type(current)(value)
+    return name, json.loads(value)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p99": percentile(values, 0.99),
+        "max": max(values, default=0.0),
+        "mean": statistics.fmean(values) if values else 0.0,
+    }
+
+
+class Replay:
+    """Feeds traffic to a bot on schedule and measures how it keeps up."""
+
+    def __init__(self, entries: List[Dict[str, Any]], speed: float):
+        self.entries = sorted(entries, key=lambda entry: entry["time"])
+        self.speed = speed
+        self.channels: Dict[Any, FakeChannel] = {}
+        self.users: Dict[Any, FakeUser] = {}
+        self.messages: Dict[Any, FakeMessage] = {}
+
+        self.triggers = 0
+        self.replies = 0
+        # Triggers awaiting a reply per channel, oldest first
+        self.waiting: Dict[int, Deque[Tuple[int, float]]] = defaultdict(deque)
+        self.arrivals: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.loop_lag: List[float] = []
+        self.peak_cache_bytes = 0
+
+    def channel(self, entry: Dict[str, Any]) -> FakeChannel:
+        channel = self.channels.get(entry["channel"])
+        if channel is None:
+            channel = self.channels[entry["channel"]] = FakeChannel(
+                f"channel-{len(self.channels)}"
+            )
+        return channel
+
+    def user(self, entry: Dict[str, Any]) -> FakeUser:
+        user = self.users.get(entry["author"])
+        if user is None:
+            user = self.users[entry["author"]] = FakeUser(
+                f"user-{len(self.users)}", bot=entry.get("author_bot", False)
+            )
+        return user
+
+    def message(self, entry: Dict[str, Any], bot_user: FakeUser) -> FakeMessage:
+        reference = None
+        if entry.get("reply_to") is not None:
+            reference = FakeReference(self.messages.get(entry["reply_to"]))
+        message = FakeMessage(
+            self.channel(entry),
+            self.user(entry),
+            entry["content"].replace(BOT_MENTION, bot_user.mention),
+            [
+                FakeAttachment(
+                    f"https://cdn.example.com/{entry['id']}/{i}.png",
+                    attachment.get("content_type") or "",
+                    attachment.get("size") or 0,
+                    attachment.get("width"),
+                    attachment.get("height"),
+                )
+                for i, attachment in enumerate(entry.get("attachments", []))
+            ],
+            [bot_user] if entry.get("mentions_bot") else [],
+            reference,
+        )
+        self.messages[entry["id"]] = message
+        return message
+
+    def instrument(self, bot):
+        """Wraps the reply scheduler to time each trigger until it is answered."""
+        scheduler = bot.message_handler.scheduler
+        submit, respond = scheduler.submit, scheduler.respond
+
+        def timed_submit(message, channel_id: int, mentioned: bool):
+            self.triggers += 1
+            arrival = self.arrivals.pop(message.id, time.perf_counter())
+            self.waiting[channel_id].append((message.id, arrival))
+            submit(message, channel_id, mentioned)
+
+        async def timed_respond(message, channel_id: int, mentioned: bool):
+            await respond(message, channel_id, mentioned)
+            self.replies += 1
+            # A reply also answers the triggers folded into it
+            now = time.perf_counter()
+            waiting = self.waiting[channel_id]
+            answered = next(
+                (arrival for id, arrival in waiting if id == message.id), None
+            )
+            while waiting and answered is not None and waiting[0][1] <= answered:
+                self.latencies.append(now - waiting.popleft()[1])
+
+        scheduler.submit = timed_submit
+        scheduler.respond = timed_respond
+
+    async def sample(self, bot):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(SAMPLE_INTERVAL)
+            self.loop_lag.append(loop.time() - start - SAMPLE_INTERVAL)
+            self.peak_cache_bytes = max(self.peak_cache_bytes, bot.cache.usage.bytes)
+
+    async def run(self, bot, drain_timeout: float) -> float:
+        """Replays every entry and waits for replies; returns the wall time."""
+        self.instrument(bot)
+        sampler = asyncio.create_task(self.sample(bot))
+        loop = asyncio.get_running_loop()
+        tasks = set()
+        start = loop.time()
+        first = self.entries[0]["time"] if self.entries else 0.0
+        try:
+            for entry in self.entries:
+                delay = start + (entry["time"] - first) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                message = self.message(entry, bot.user)
+                self.arrivals[message.id] = time.perf_counter()
+                # discord.py dispatches each event as its own task
+                task = asyncio.create_task(bot.on_message(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            deadline = loop.time() + drain_timeout
+            while (
+                bot.message_handler.scheduler.workers or bot.outbox.workers
+            ) and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            return loop.time() - start
+        finally:
+            sampler.cancel()
+
+    def report(self, bot, stub: StubLLM, wall_time: float) -> Dict[str, Any]:
+        recorded = (
+            self.entries[-1]["time"] - self.entries[0]["time"] if self.entries else 0.0
+        )
+        return {
+            "messages": len(self.entries),
+            "channels": len(self.channels),
+            "recorded_seconds": recorded,
+            "wall_seconds": wall_time,
+            "triggers": self.triggers,
+            "replies": self.replies,
+            "unanswered": sum(len(waiting) for waiting in self.waiting.values()),
+            "reply_latency_seconds": summarize(self.latencies),
+            "llm_requests": stub.requests,
+            "llm_streamed": stub.streamed,
+            "llm_injected_errors": stub.errors,
+            "cache_peak_bytes": self.peak_cache_bytes,
+            "cache_final_bytes": bot.cache.usage.bytes,
+            # ru_maxrss is in KiB on Linux
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            * 1024,
+            "loop_lag_seconds": summarize(self.loop_lag),
+        }
+
+
+async def replay(args) -> Dict[str, Any]:
+    entries = []
+    # Shard workers each record to their own file
+    for path in args.traffic:
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+
+    stub = StubLLM(args.latency, args.token_interval, args.error_rate, seed=args.seed)
+    url = await stub.start()
+    replay = Replay(entries, args.speed)
+    # Channels are created up front so designated ones can be configured
+    designated = {
+        replay.channel(entry).id for entry in replay.entries if entry.get("designated")
+    }
+    config = make_config(LOCAL_CLIENT_URL=url, DESIGNATED_CHANNELS=sorted(designated))
+    config = dataclasses.replace(
+        config, **dict(parse_override(config, setting) for setting in args.set)
+    )
+    bot = await make_bot(config)
+    try:
+        wall_time = await replay.run(bot, args.drain_timeout)
+        return replay.report(bot, stub, wall_time)
+    finally:
+        await bot.close()
+        await stub.close()
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["reply_latency_seconds"]
+    lag = report["loop_lag_seconds"]
+    print(
+        f"messages {report['messages']} in {report['channels']} channels, "
+        f"{report['recorded_seconds']:.1f}s recorded, "
+        f"{report['wall_seconds']:.1f}s replayed\n"
+        f"triggers {report['triggers']}, replies {report['replies']}, "
+        f"unanswered {report['unanswered']}\n"
+        f"reply latency p50 {latency['p50']:.3f}s  p90 {latency['p90']:.3f}s  "
+        f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s\n"
+        f"llm requests {report['llm_requests']} "
+        f"({report['llm_streamed']} streamed, "
+        f"{report['llm_injected_errors']} injected errors)\n"
+        f"cache peak {report['cache_peak_bytes'] / 1024 / 1024:.1f} MiB, "
+        f"process peak RSS {report['process_peak_rss_bytes'] / 1024 / 1024:.1f} MiB\n"
+        f"loop lag p50 {lag['p50'] * 1000:.1f}ms  p99 {lag['p99'] * 1000:.1f}ms  "
+        f"max {lag['max'] * 1000:.1f}ms",
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="write synthetic traffic")
+    gen.add_argument("output", help="JSONL file to write")
+    gen.add_argument("--channels", type=int, default=20)
+    gen.add_argument("--messages", type=int, default=2000)
+    gen.add_argument(
+        "--duration", type=float, default=600.0, help="seconds of traffic"
+    )
+    gen.add_argument("--mention-rate", type=float, default=0.2)
+    gen.add_argument("--reply-rate", type=float, default=0.1)
+    gen.add_argument("--image-rate", type=float, default=0.05)
+    gen.add_argument("--seed", type=int)
+
+    run = commands.add_parser("run", help="replay traffic and report")
+    run.add_argument(
+        "traffic", nargs="+", help="JSONL files from the recorder or generate"
+    )
+    run.add_argument(
+        "--speed", type=float, default=1.0, help="replay this many times faster"
+    )
+    run.add_argument(
+        "--latency", type=float, default=0.5, help="mean LLM first-token seconds"
+    )
+    run.add_argument("--token-interval", type=float, default=0.02)
+    run.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of LLM calls that fail"
+    )
+    run.add_argument(
+        "--drain-timeout",
+        type=float,
+        default=60.0,
+        help="seconds to wait for replies after the last message",
+    )
+    run.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a config setting, e.g. LLM_MAX_IN_FLIGHT=16",
+    )
+    run.add_argument("--seed", type=int)
+    run.add_argument("--output", help="write the JSON report to this file")
+    run.add_argument("--verbose", action="store_true", help="show the bot's logs")
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        generate(
+            args.output,
+            args.channels,
+            args.messages,
+            args.duration,
+            args.mention_rate,
+            args.reply_rate,
+            args.image_rate,
+            args.seed,
+        )
+        return
+
+    if not args.verbose:
+        logging.getLogger("chatbot").setLevel(logging.ERROR)
+        logging.getLogger("discord").setLevel(logging.ERROR)
+    report = asyncio.run(replay(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
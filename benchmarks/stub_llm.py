@@ -0,0 +1,136 @@
+# benchmarks/stub_llm.py
+"""A local OpenAI-compatible chat completions server with fake latency."""
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+REPLY = "lmao no way. pineapple on pizza is a crime and I will die on this hill!"
+
+
+class StubLLM:
+    """Answers chat completions after a configurable delay, sometimes failing.
+
+    `latency` is the mean time to the first token (drawn from an exponential
+    distribution around it), and streamed replies then send one word every
+    `token_interval` seconds. A share `error_rate` of requests fail with a
+    retryable 500 error.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        token_interval: float = 0.02,
+        error_rate: float = 0.0,
+        reply: str = REPLY,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.words = reply.split(" ")
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.streamed = 0
+        self.errors = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts serving and returns the base URL for the OpenAI client."""
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/v1"
+        return self.url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency))
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {"error": {"message": "injected failure", "type": "server_error"}},
+                status=500,
+            )
+
+        prompt_tokens = sum(
+            len(json.dumps(message["content"])) // 4 for message in body["messages"]
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(self.words),
+            "total_tokens": prompt_tokens + len(self.words),
+        }
+        if not body.get("stream"):
+            return web.json_response(
+                self.completion(
+                    body,
+                    choices=[
+                        {
+                            "index": 0,
+                            "message": {
+                                "role": "assistant",
+                                "content": " ".join(self.words),
+                            },
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    usage=usage,
+                )
+            )
+
+        self.streamed += 1
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        for i, word in enumerate(self.words):
+            if i and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            delta = {"content": word if i == 0 else f" {word}"}
+            await self.send_event(
+                response,
+                self.completion(
+                    body,
+                    object="chat.completion.chunk",
+                    choices=[{"index": 0, "delta": delta, "finish_reason": None}],
+                ),
+            )
+        await self.send_event(
+            response,
+            self.completion(
+                body, object="chat.completion.chunk", choices=[], usage=usage
+            ),
+        )
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def completion(body: Dict[str, Any], **fields: Any) -> Dict[str, Any]:
+        return {
+            "id": f"stub-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            **fields,
+        }
+
+    @staticmethod
+    async def send_event(response: web.StreamResponse, payload: Dict[str, Any]):
+        await response.write(f"data: {json.dumps(payload)}\n\n".encode())
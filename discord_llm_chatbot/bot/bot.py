@@ -1,42 +1,206 @@
 # bot/bot.py
-from typing import Dict
+import asyncio
+import logging
+from typing import List, Optional
 
 import discord
-from discord.ext.commands import Bot
+from discord.ext.commands import AutoShardedBot
 from discord.message import Message
 
 from ..config.config import Config
+from ..utils.image_processor import ImageProcessor, pillow_available
+from ..utils.image_validator import ImageValidator
+from ..utils.jobs import JobScheduler
+from ..utils.metrics import MetricsServer, metrics
+from ..utils.openai_client import backend_specs
+from ..utils.persistence import SQLitePersistence
+from ..utils.tokenizer import TokenCounter
+from ..utils.traffic_recorder import TrafficRecorder
 from .activity_handler import ActivityHandler
 from .command_handler import CommandHandler
+from .conversation_store import ConversationStore
 from .fun_commands import FunCommands
 from .message_handler import MessageHandler
+from .outbox import Outbox
+from .summarizer import HistorySummarizer
+from .triggers import TriggerEngine
 
+# Seconds between runs of background housekeeping jobs
+HOUSEKEEPING_INTERVAL = 3600
 
-class MyBot(Bot):
-    def __init__(self, config: Config):
+log = logging.getLogger("chatbot")
+message_log = logging.getLogger("chatbot.messages")
+
+
+class MyBot(AutoShardedBot):
+    def __init__(self, config: Config, shard_ids: Optional[List[int]] = None):
         intents = discord.Intents.default()
         intents.message_content = True
         intents.guilds = True
         intents.guild_messages = True
 
-        super().__init__(command_prefix="$", intents=intents)
+        # Without a shard count Discord's recommendation is used, with every
+        # shard in this process; shard workers pass the shards they own.
+        super().__init__(
+            command_prefix="$",
+            intents=intents,
+            shard_count=config.SHARD_COUNT or None,
+            shard_ids=shard_ids,
+        )
 
         self.config = config
-        self.cache: Dict[str, list] = {}
+        self.jobs = JobScheduler()
+        self.warm_up_task: Optional["asyncio.Task[None]"] = None
+        self.persistence = (
+            SQLitePersistence(
+                config.HISTORY_DB_PATH,
+                config.PERSISTENCE_BATCH_SIZE,
+                config.PERSISTENCE_FLUSH_INTERVAL,
+                config.PERSISTENCE_READ_TIMEOUT,
+            )
+            if config.HISTORY_DB_PATH
+            else None
+        )
+        # Counts with the preferred backend's tokenizer; fallbacks are close enough
+        self.token_counter = TokenCounter(
+            backend_specs(config)[0].model, config.IMAGE_TOKEN_COST
+        )
+        self.cache = ConversationStore(
+            self.token_counter,
+            self.persistence,
+            config.CACHE_MEMORY_BUDGET,
+            config.CHANNEL_TOKEN_LIMIT,
+            config.CHANNEL_MESSAGE_LIMIT,
+            config.SUMMARY_MAX_EVICTED,
+        )
+        self.image_validator = ImageValidator(config)
+        self.image_processor = (
+            ImageProcessor(config, self.image_validator)
+            if config.IMAGE_PREPROCESS and pillow_available()
+            else None
+        )
+        self.outbox = Outbox(self.http, config.DISCORD_CHARACTER_LIMIT)
+        self.metrics_server = (
+            MetricsServer(config.METRICS_HOST, config.METRICS_PORT)
+            if config.METRICS_PORT
+            else None
+        )
+        metrics.register_gauge(
+            "conversation_cache_bytes",
+            "Estimated memory held by cached conversation history.",
+            lambda: [({}, self.cache.usage.bytes)],
+        )
+        metrics.register_gauge(
+            "conversation_cache_channels",
+            "Channels whose history is held in memory.",
+            lambda: [({}, len(self.cache))],
+        )
+        metrics.register_gauge(
+            "channel_history_tokens",
+            "Tokens of conversation history held per channel.",
+            lambda: (
+                ({"channel": str(channel_id)}, history.num_tokens)
+                for channel_id, history in self.cache.channels.items()
+            ),
+        )
+        metrics.register_gauge(
+            "channel_history_messages",
+            "Messages of conversation history held per channel.",
+            lambda: (
+                ({"channel": str(channel_id)}, len(history))
+                for channel_id, history in self.cache.channels.items()
+            ),
+        )
 
         # Initialize handlers
         self.message_handler = MessageHandler(self)
         self.activity_handler = ActivityHandler(self)
         self.command_handler = CommandHandler(self)
         self.fun_commands = FunCommands(self)
+        self.summarizer = HistorySummarizer(self)
+        self.triggers = TriggerEngine(
+            {
+                "!chubmeter": self.fun_commands.chubcheck,
+                "!chugmeter": self.fun_commands.chugmeter,
+            },
+            config.REPLY_KEYWORDS,
+            config.CHANNEL_REPLY_KEYWORDS,
+            config.DESIGNATED_CHANNELS,
+        )
+        self.recorder = (
+            TrafficRecorder(
+                config.TRAFFIC_RECORD_PATH,
+                self.triggers.keywords,
+                config.TRAFFIC_RECORD_SALT,
+            )
+            if config.TRAFFIC_RECORD_PATH
+            else None
+        )
 
         # Setup commands
         self.command_handler.setup_commands()
 
+    async def setup_hook(self):
+        """Starts background services before connecting to Discord."""
+        await self.image_validator.start()
+        # Import heavy dependencies on worker threads while logging in
+        self.warm_up_task = asyncio.create_task(self.warm_up())
+        if self.metrics_server:
+            await self.metrics_server.start()
+        if self.persistence:
+            self.persistence.start()
+            self.jobs.schedule(
+                "prune_reply_claims",
+                HOUSEKEEPING_INTERVAL,
+                self.persistence.prune_claims,
+                jitter=HOUSEKEEPING_INTERVAL * 0.1,
+                run_immediately=True,
+            )
+        if self.config.CHANNEL_IDLE_TIMEOUT:
+            self.jobs.schedule(
+                "evict_idle_channels",
+                self.config.CHANNEL_IDLE_CHECK_INTERVAL,
+                lambda: self.cache.evict_idle(self.config.CHANNEL_IDLE_TIMEOUT),
+            )
+        if self.config.SUMMARY_MAX_EVICTED:
+            self.jobs.schedule(
+                "summarize_history",
+                self.config.SUMMARY_INTERVAL,
+                self.summarizer.run,
+            )
+        self.jobs.schedule(
+            "purge_image_cache",
+            HOUSEKEEPING_INTERVAL,
+            self.image_validator.purge_expired,
+            jitter=HOUSEKEEPING_INTERVAL * 0.1,
+        )
+        if self.image_processor:
+            self.jobs.schedule(
+                "prune_processed_images",
+                HOUSEKEEPING_INTERVAL,
+                self.image_processor.prune,
+                jitter=HOUSEKEEPING_INTERVAL * 0.1,
+                run_immediately=True,
+            )
+        elif self.config.IMAGE_PREPROCESS:
+            log.info("Pillow is not installed; images are sent as Discord URLs")
+        if self.recorder:
+            self.jobs.schedule(
+                "flush_traffic_record",
+                self.config.TRAFFIC_RECORD_FLUSH_INTERVAL,
+                self.recorder.flush,
+            )
+
+    async def warm_up(self):
+        await self.message_handler.openai_client.warm_up()
+        await self.fun_commands.refill_chug_pool()
+
     async def on_ready(self):
         """Called when the bot is ready and connected to Discord."""
-        print(f"Logged in as { self.user}!")
-        await self.tree.sync()
+        log.info("Logged in as %s with shards %s!", self.user, sorted(self.shards))
+        # Commands are global, so only the worker that owns shard 0 syncs them
+        if 0 in self.shards:
+            await self.tree.sync()
         await self.activity_handler.start()
 
     async def on_message(self, message: Message):
@@ -44,16 +208,49 @@ class MyBot(Bot):
         if message.author == self.user or not message.content.strip():
             return
 
-        print(
-            f"Message from { message.author}, {message.guild}, {message.channel}: {message.content}"
-        )
+        metrics.inc("messages_seen_total")
+        if self.recorder:
+            self.recorder.record(
+                message,
+                self.user.id,
+                self.triggers.is_designated(message.channel.id),
+            )
+        with metrics.time("on_message"):
+            # Formatting is deferred to the logging thread; sampling happens first
+            message_log.info(
+                "Message from %s, %s, %s: %s",
+                message.author,
+                message.guild,
+                message.channel,
+                message.content,
+                extra={
+                    "author_id": message.author.id,
+                    "channel_id": message.channel.id,
+                    "message_id": message.id,
+                },
+            )
 
-        # Handle fun commands
-        if message.content.startswith("!chubmeter"):
-            await self.fun_commands.chubcheck(message)
-            return
-        elif message.content.startswith("!chugmeter"):
-            await self.fun_commands.chugmeter(message)
-            return
+            # Handle fun commands
+            command = self.triggers.command(message.content)
+            if command:
+                await command(message)
+                return
+
+            await self.message_handler.handle_message(message)
 
-        await self.message_handler.handle_message(message)
+    async def close(self):
+        """Closes the Discord connection and releases shared clients."""
+        await super().close()
+        if self.warm_up_task:
+            self.warm_up_task.cancel()
+        await self.jobs.close()
+        await self.message_handler.scheduler.close()
+        await self.outbox.close()
+        await self.message_handler.openai_client.close()
+        await self.image_validator.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
+        if self.persistence:
+            await self.persistence.close()
+        if self.recorder:
+            self.recorder.close()
@@ -0,0 +1,63 @@
+# bot/channel_scheduler.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Tuple
+
+from discord.message import Message
+
+log = logging.getLogger("chatbot.replies")
+
+Respond = Callable[[Message, int, bool], Awaitable[None]]
+
+
+class ChannelScheduler:
+    """Runs at most one reply generation per channel at a time.
+
+    Messages that trigger a reply while one is being generated are folded
+    into a single follow-up, sent after a short debounce. The follow-up
+    answers the latest trigger, preferring the latest mention; earlier
+    triggers are already part of the channel history it sees.
+    """
+
+    def __init__(self, respond: Respond, debounce: float):
+        self.respond = respond
+        self.debounce = debounce
+        self.pending: Dict[int, Tuple[Message, bool]] = {}
+        self.workers: Dict[int, "asyncio.Task[None]"] = {}
+
+    def is_busy(self, channel_id: int) -> bool:
+        return channel_id in self.workers
+
+    def submit(self, message: Message, channel_id: int, mentioned: bool):
+        """Schedules a reply to `message` in its channel."""
+        queued = self.pending.get(channel_id)
+        # Never let a keyword trigger replace a queued mention
+        if queued is None or mentioned or not queued[1]:
+            self.pending[channel_id] = (message, mentioned)
+
+        if channel_id not in self.workers:
+            self.workers[channel_id] = asyncio.create_task(self.run(channel_id))
+
+    async def run(self, channel_id: int):
+        try:
+            first = True
+            while channel_id in self.pending:
+                if not first:
+                    await asyncio.sleep(self.debounce)
+                first = False
+
+                message, mentioned = self.pending.pop(channel_id)
+                try:
+                    await self.respond(message, channel_id, mentioned)
+                except Exception as e:
+                    log.exception("Error responding in channel %s: %s", channel_id, e)
+        finally:
+            del self.workers[channel_id]
+
+    async def close(self):
+        """Cancels all in-flight generations."""
+        self.pending.clear()
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -2,6 +2,8 @@ from typing import TYPE_CHECKING
 
 from discord.ext.commands import Context
 
+from ..utils.metrics import metrics
+
 if TYPE_CHECKING:
     from .bot import MyBot
 
@@ -27,6 +29,10 @@ class CommandHandler:
         async def sync(ctx: Context):
             await self.sync_commands(ctx)
 
+        @self.bot.hybrid_command(name="stats", description="Show latency stats")
+        async def stats(ctx: Context):
+            await self.show_stats(ctx)
+
         @self.bot.hybrid_command(name="creator", description="Who created me?")
         async def creator(ctx: Context):
             await self.say_creator(ctx)
@@ -42,9 +48,7 @@ class CommandHandler:
     async def clear_cache(self, ctx: Context):
         """Clears the cache for the current channel."""
         await ctx.defer()
-        server_channel = f"{ ctx.guild}{ctx.channel}"
-        if server_channel in self.bot.cache and self.bot.cache[server_channel]:
-            self.bot.cache[server_channel] = []
+        if await self.bot.cache.clear(ctx.channel.id):
             await ctx.send("I have suddenly developed amnesia, UwU!", ephemeral=False)
         else:
             await ctx.send(
@@ -60,11 +64,29 @@ class CommandHandler:
         else:
             await ctx.send("You must be the owner to use this command!")
 
+    async def show_stats(self, ctx: Context):
+        """Sends per-stage latency and counters to the owner."""
+        await ctx.defer()
+        if str(ctx.author.id) != self.bot.config.OWNER_ID:
+            await ctx.send("You must be the owner to use this command!")
+            return
+
+        channels = self.bot.cache.channels
+        history_tokens = sum(history.num_tokens for history in channels.values())
+        summary = (
+            f"{metrics.summary()}\n"
+            f"channels cached: {len(channels)}\n"
+            f"history tokens: {history_tokens}\n"
+            f"history memory: {self.bot.cache.usage.bytes / 1024 / 1024:.1f} MiB"
+        )
+        # Leave room for the code block fences
+        limit = self.bot.config.DISCORD_CHARACTER_LIMIT - 8
+        await ctx.send(f"```\n{summary[:limit]}\n```")
+
     async def say_creator(self, ctx: Context):
         """Sends a message with the bot creator's info."""
         await ctx.defer()
         await ctx.send(f"I was created by <@!{ self.bot.config.OWNER_ID}>!")
-        await ctx.send(f"I was created by <@!{ self.bot.config.OWNER_ID}>!")
 
     # async def spin_game(self, ctx: commands.Context, user: discord.Member = None):
     #     """Randomly picks a spin-the-bottle prompt and directs it at a user or the invoker."""
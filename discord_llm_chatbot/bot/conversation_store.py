@@ -0,0 +1,458 @@
+# bot/conversation_store.py
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from ..utils.metrics import metrics
+from ..utils.persistence import PersistenceBackend
+from ..utils.tokenizer import TokenCounter
+
+log = logging.getLogger("chatbot.history")
+
+# Approximate memory held by a cached message besides its strings: the
+# object itself, its datetime and the prompt dicts and lists built from it.
+MESSAGE_BASE_BYTES = 900
+IMAGE_PART_BYTES = 500
+
+
+class CachedMessage:
+    """A single message remembered in a channel's conversation history."""
+
+    __slots__ = (
+        "created_at",
+        "author_id",
+        "author_name",
+        "content",
+        "reply_to_id",
+        "image_urls",
+        "role",
+        "seq",
+        "prompt",
+        "num_tokens",
+        "num_bytes",
+    )
+
+    def __init__(
+        self,
+        created_at: datetime,
+        author_id: int,
+        author_name: str,
+        content: str,
+        reply_to_id: Optional[int] = None,
+        image_urls: Optional[List[str]] = None,
+        role: str = "user",
+        seq: int = 0,
+    ):
+        self.created_at = created_at
+        self.author_id = author_id
+        self.author_name = author_name
+        self.content = content
+        self.reply_to_id = reply_to_id
+        self.image_urls = image_urls or []
+        self.role = role
+        self.seq = seq
+        # The message as sent to the model, built once and reused per reply
+        self.prompt: Dict[str, Any] = {"role": role, "content": self.prompt_content()}
+        # Counted by the owning history when the message is added
+        self.num_tokens = 0
+        self.num_bytes = 0
+
+    def prompt_content(self) -> List[Dict[str, Any]]:
+        """Converts the message into OpenAI content parts."""
+        content: List[Dict[str, Any]] = []
+        if self.content:  # Add text content
+            content.append({"type": "text", "text": self.content})
+        for url in self.image_urls:  # Add image URLs
+            content.append({"type": "image_url", "image_url": {"url": url}})
+        return content
+
+    def set_image_urls(self, image_urls: List[str]):
+        """Replaces the message's images and refreshes its prompt in place."""
+        self.image_urls = image_urls
+        self.prompt["content"] = self.prompt_content()
+
+    def size(self) -> int:
+        """Estimates the bytes of memory the message holds."""
+        # The prompt's text part shares the `content` string
+        return (
+            MESSAGE_BASE_BYTES
+            + sys.getsizeof(self.content)
+            + sys.getsizeof(self.author_name)
+            + sum(sys.getsizeof(url) + IMAGE_PART_BYTES for url in self.image_urls)
+        )
+
+
+class CacheUsage:
+    """Running memory total shared by every channel of a store."""
+
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+class ChannelHistory:
+    """Conversation history for one channel with running size counters."""
+
+    __slots__ = (
+        "channel_id",
+        "backend",
+        "token_counter",
+        "messages",
+        "prompts",
+        "image_messages",
+        "num_tokens",
+        "num_images",
+        "num_bytes",
+        "next_seq",
+        "usage",
+        "max_tokens",
+        "max_messages",
+        "last_used",
+        "summary",
+        "summary_prompt",
+        "summary_tokens",
+        "evicted",
+        "max_evicted",
+        "generation",
+    )
+
+    def __init__(
+        self,
+        channel_id: int,
+        token_counter: TokenCounter,
+        backend: Optional[PersistenceBackend] = None,
+        usage: Optional[CacheUsage] = None,
+        max_tokens: int = 0,
+        max_messages: int = 0,
+        max_evicted: int = 0,
+    ):
+        self.channel_id = channel_id
+        self.token_counter = token_counter
+        self.backend = backend
+        # Detached when the channel is evicted from its store
+        self.usage = usage
+        # Caps enforced on every append (0 disables them)
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.last_used = time.monotonic()
+        self.messages: Deque[CachedMessage] = deque()
+        # Prompt dicts of `messages`, kept in step so a request is one copy
+        self.prompts: Deque[Dict[str, Any]] = deque()
+        # Messages that still carry images, oldest first, so image trimming
+        # never has to scan text-only history.
+        self.image_messages: Deque[CachedMessage] = deque()
+        self.num_tokens = 0
+        self.num_images = 0
+        self.num_bytes = 0
+        self.next_seq = 1
+        # Running summary of evicted history, sent after the system prompt
+        self.summary = ""
+        self.summary_prompt: Optional[Dict[str, Any]] = None
+        self.summary_tokens = 0
+        # Evicted messages waiting to be folded into the summary, oldest first.
+        # They still count towards `num_bytes` until they are folded or dropped.
+        self.evicted: Deque[CachedMessage] = deque()
+        self.max_evicted = max_evicted
+        # Bumped by `clear`, so work started on the old history can be dropped
+        self.generation = 0
+
+    def __iter__(self) -> Iterator[CachedMessage]:
+        return iter(self.messages)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def restore(self, messages: List[CachedMessage]):
+        """Loads persisted messages without writing them back."""
+        for message in messages:
+            self.add(message)
+        if self.messages:
+            self.next_seq = self.messages[-1].seq + 1
+
+    def append(self, message: CachedMessage):
+        """Adds a message to the end of the history, enforcing the caps."""
+        message.seq = self.next_seq
+        self.next_seq += 1
+        self.add(message)
+        if self.backend:
+            self.backend.append(self.channel_id, message)
+
+        evicted = None
+        while self.max_messages and len(self.messages) > self.max_messages:
+            evicted = self.evict_oldest()
+        # Always keep the newest message, even if it alone is over the cap
+        while (
+            self.max_tokens
+            and len(self.messages) > 1
+            and self.num_tokens > self.max_tokens
+        ):
+            evicted = self.evict_oldest()
+        if evicted is not None and self.backend:
+            self.backend.evict(self.channel_id, evicted.seq)
+
+    def add(self, message: CachedMessage):
+        self.messages.append(message)
+        self.prompts.append(message.prompt)
+        message.num_tokens = self.token_counter.count_message(message.prompt)
+        self.num_tokens += message.num_tokens
+        if message.image_urls:
+            self.image_messages.append(message)
+            self.num_images += len(message.image_urls)
+        message.num_bytes = message.size()
+        self.resize(message.num_bytes)
+
+    def resize(self, delta: int):
+        self.num_bytes += delta
+        if self.usage is not None:
+            self.usage.bytes += delta
+
+    def popleft(self) -> CachedMessage:
+        """Evicts and returns the oldest message."""
+        message = self.messages.popleft()
+        self.prompts.popleft()
+        self.num_tokens -= message.num_tokens
+        if self.image_messages and self.image_messages[0] is message:
+            self.image_messages.popleft()
+            self.num_images -= len(message.image_urls)
+        self.resize(-message.num_bytes)
+        return message
+
+    def evict_oldest(self) -> CachedMessage:
+        """Pops the oldest message, keeping it for the summary if enabled."""
+        message = self.popleft()
+        if self.max_evicted and message.content:
+            if len(self.evicted) >= self.max_evicted:
+                self.drop_evicted()
+            self.evicted.append(message)
+            self.resize(message.num_bytes)
+        return message
+
+    def drop_evicted(self) -> CachedMessage:
+        """Forgets the oldest evicted message waiting for the summary."""
+        message = self.evicted.popleft()
+        self.resize(-message.num_bytes)
+        return message
+
+    def trim_tokens(self, limit: int, low: Optional[int] = None):
+        """Evicts the oldest messages once the history exceeds `limit` tokens.
+
+        With a `low` watermark, trimming goes down to it in one block, so the
+        front of the history (and the prompt prefix) stays the same until
+        the limit is hit again.
+        """
+        if self.num_tokens <= limit:
+            return
+        target = limit if low is None else low
+        evicted = None
+        while self.messages and self.num_tokens > target:
+            evicted = self.evict_oldest()
+        if evicted is not None and self.backend:
+            self.backend.evict(self.channel_id, evicted.seq)
+
+    def trim_images(self, limit: int):
+        """Drops images from the oldest messages so at most `limit` remain."""
+        while self.num_images > limit:
+            message = self.image_messages[0]
+            keep = max(0, len(message.image_urls) - (self.num_images - limit))
+            self.replace_images(message, message.image_urls[:keep])
+
+    def replace_images(self, message: CachedMessage, image_urls: List[str]):
+        """Swaps a message's images for a subset, keeping counters in step."""
+        removed = len(message.image_urls) - len(image_urls)
+        message.set_image_urls(image_urls)
+        self.num_images -= removed
+        message.num_tokens -= removed * self.token_counter.image_tokens
+        self.num_tokens -= removed * self.token_counter.image_tokens
+        size = message.size()
+        self.resize(size - message.num_bytes)
+        message.num_bytes = size
+        if not image_urls:
+            self.image_messages.remove(message)
+        if self.backend:
+            self.backend.update_images(self.channel_id, message.seq, image_urls)
+
+    def set_summary(self, summary: str, folded_seq: int = 0):
+        """Replaces the summary, which now covers evictions up to `folded_seq`.
+
+        Messages evicted since the summary was started stay queued for the
+        next one.
+        """
+        while self.evicted and self.evicted[0].seq <= folded_seq:
+            self.drop_evicted()
+        self.resize(sys.getsizeof(summary) - sys.getsizeof(self.summary))
+        self.summary = summary
+        if summary:
+            self.summary_prompt = {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+            self.summary_tokens = self.token_counter.count_message(self.summary_prompt)
+        else:
+            self.summary_prompt = None
+            self.summary_tokens = 0
+        if folded_seq and self.backend:
+            self.backend.save_summary(self.channel_id, summary)
+
+    def prompt_messages(self) -> List[Dict[str, Any]]:
+        """Returns the history as OpenAI chat messages, oldest first."""
+        return list(self.prompts)
+
+    def clear(self):
+        """Forgets the whole history."""
+        self.messages.clear()
+        self.prompts.clear()
+        self.image_messages.clear()
+        self.num_tokens = 0
+        self.num_images = 0
+        self.evicted.clear()
+        self.generation += 1
+        self.set_summary("")
+        self.resize(-self.num_bytes)
+        if self.backend:
+            self.backend.clear(self.channel_id)
+
+
+class ConversationStore:
+    """Per-channel conversation histories keyed by Discord channel ID.
+
+    When a persistence backend is configured, a channel's history is loaded
+    from it the first time the channel is touched after startup.
+
+    Memory is bounded by per-channel caps applied on append and a global
+    byte budget; over budget, or when idle for too long, whole channels are
+    evicted least recently used first. Evicted channels are reloaded from
+    the backend if they become active again.
+    """
+
+    def __init__(
+        self,
+        token_counter: TokenCounter,
+        backend: Optional[PersistenceBackend] = None,
+        max_bytes: int = 0,
+        max_channel_tokens: int = 0,
+        max_channel_messages: int = 0,
+        max_evicted: int = 0,
+    ):
+        self.token_counter = token_counter
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.max_channel_tokens = max_channel_tokens
+        self.max_channel_messages = max_channel_messages
+        self.max_evicted = max_evicted
+        self.usage = CacheUsage()
+        # Least recently used first
+        self.channels: "OrderedDict[int, ChannelHistory]" = OrderedDict()
+        self.loading: Dict[int, "asyncio.Task[ChannelHistory]"] = {}
+        # Channels that must stay in memory, e.g. while a reply is generated
+        self.pinned: Callable[[int], bool] = lambda channel_id: False
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self.channels
+
+    def __len__(self) -> int:
+        return len(self.channels)
+
+    def new_history(self, channel_id: int) -> ChannelHistory:
+        return ChannelHistory(
+            channel_id,
+            self.token_counter,
+            self.backend,
+            self.usage,
+            self.max_channel_tokens,
+            self.max_channel_messages,
+            self.max_evicted,
+        )
+
+    def get(self, channel_id: int) -> ChannelHistory:
+        """Returns the in-memory history for a channel, creating it if needed.
+
+        Use `load` for the first access to a channel so persisted history is
+        not shadowed by an empty one.
+        """
+        history = self.channels.get(channel_id)
+        if history is None:
+            history = self.channels[channel_id] = self.new_history(channel_id)
+        else:
+            self.channels.move_to_end(channel_id)
+        history.last_used = time.monotonic()
+        return history
+
+    async def load(self, channel_id: int) -> ChannelHistory:
+        """Returns the history for a channel, loading it from the backend once."""
+        if channel_id in self.channels or self.backend is None:
+            return self.get(channel_id)
+
+        task = self.loading.get(channel_id)
+        if task is None:
+            task = self.loading[channel_id] = asyncio.create_task(
+                self.restore(channel_id)
+            )
+        return await asyncio.shield(task)
+
+    async def restore(self, channel_id: int) -> ChannelHistory:
+        try:
+            messages = await self.backend.load_channel(channel_id)
+            summary = await self.backend.load_summary(channel_id)
+        except Exception as e:
+            log.error("Error loading history for channel %s: %s", channel_id, e)
+            messages, summary = [], ""
+
+        history = self.new_history(channel_id)
+        history.restore(messages)
+        history.set_summary(summary)
+        self.channels[channel_id] = history
+        del self.loading[channel_id]
+        return history
+
+    def evict(self, channel_id: int):
+        """Drops a channel from memory; persisted history is kept."""
+        history = self.channels.pop(channel_id)
+        history.resize(-history.num_bytes)
+        # Late appends through stale references must not count towards usage
+        history.usage = None
+        metrics.inc("channels_evicted_total")
+
+    def enforce_budget(self):
+        """Evicts least recently used channels until usage fits the budget.
+
+        The most recently used channel is always kept.
+        """
+        if not self.max_bytes or self.usage.bytes <= self.max_bytes:
+            return
+        for channel_id in list(self.channels)[:-1]:
+            if self.usage.bytes <= self.max_bytes:
+                break
+            if not self.pinned(channel_id):
+                self.evict(channel_id)
+
+    async def evict_idle(self, max_idle: float):
+        """Evicts channels that have not been used for `max_idle` seconds."""
+        cutoff = time.monotonic() - max_idle
+        for channel_id, history in list(self.channels.items()):
+            if history.last_used > cutoff:
+                break
+            if not self.pinned(channel_id):
+                self.evict(channel_id)
+
+    async def claim_reply(self, message_id: int) -> bool:
+        """Returns whether this process should answer the message."""
+        if self.backend is None:
+            return True
+        try:
+            return await self.backend.claim_reply(message_id)
+        except Exception as e:
+            log.error("Error claiming reply to message %s: %s", message_id, e)
+            return True
+
+    async def clear(self, channel_id: int) -> bool:
+        """Clears a channel's history, returning whether there was any."""
+        history = await self.load(channel_id)
+        if not history:
+            return False
+        history.clear()
+        return True
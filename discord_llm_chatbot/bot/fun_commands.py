@@ -1,19 +1,52 @@
 # bot/fun_commands.py
 import asyncio
 import random
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, List, Optional
 
-import numpy as np
 from discord.message import Message
-from scipy.stats import triang
 
 if TYPE_CHECKING:
     from .bot import MyBot
 
+# Chug fractions are drawn in bulk and handed out one per command
+CHUG_POOL_SIZE = 10000
+CHUG_REFILL_AT = 100
+
+
+def sample_chug_fractions(size: int) -> List[float]:
+    """Draws chug fractions from an exponentially skewed triangular distribution."""
+    # Imported here since scipy alone adds most of a second to startup
+    import numpy as np
+    from scipy.stats import triang
+
+    loc, scale = 0.1, 0.9
+    c = 0
+    tri_dist = triang(c, loc=loc, scale=scale)
+    raw_samples = tri_dist.rvs(size=size)
+    skew_factor = 0.1
+    exp_skewed_samples = np.exp(-skew_factor * (raw_samples - loc) / scale)
+    normalized_samples = raw_samples * exp_skewed_samples / np.max(exp_skewed_samples)
+    return normalized_samples.tolist()
+
 
 class FunCommands:
     def __init__(self, bot: "MyBot"):
         self.bot = bot
+        self.chug_pool: List[float] = []
+        self.refill_task: Optional["asyncio.Task[None]"] = None
+
+    def refill_chug_pool(self) -> "asyncio.Task[None]":
+        """Refills the chug pool on a worker thread, once at a time."""
+        if self.refill_task is None:
+            self.refill_task = asyncio.create_task(self.fill_chug_pool())
+        return self.refill_task
+
+    async def fill_chug_pool(self):
+        try:
+            samples = await asyncio.to_thread(sample_chug_fractions, CHUG_POOL_SIZE)
+            self.chug_pool.extend(samples)
+        finally:
+            self.refill_task = None
 
     async def chubcheck(self, message: Message):
         """Handles the chubcheck command."""
@@ -23,26 +56,21 @@ class FunCommands:
             return m.author.name == "Carl-bot" and m.author.discriminator == "1536" and m.channel == message.channel
 
         try:
-            await self.wait_for('message', check=check_carl_response, timeout=3)
+            await self.bot.wait_for('message', check=check_carl_response, timeout=3)
             return
         except asyncio.TimeoutError:
             chub_percentage = random.randint(0, 100)
             freak_percentage = random.randint(0, 100)
             response = f"{nickname} is at {chub_percentage}% chub & {freak_percentage}% freak 👅💦"
-            await message.channel.send(response)
+            await self.bot.outbox.send(message.channel, response)
 
     async def chugmeter(self, message: Message):
         """Handles the chugmeter command."""
         nickname = message.author.display_name
-        loc, scale = 0.1, 0.9
-        c = 0
-        tri_dist = triang(c, loc=loc, scale=scale)
-        raw_samples = tri_dist.rvs(size=1000)
-        skew_factor = 0.1
-        exp_skewed_samples = np.exp(-skew_factor * (raw_samples - loc) / scale)
-        normalized_samples = (
-            raw_samples * exp_skewed_samples / np.max(exp_skewed_samples)
-        )
-        chug_time = int(np.random.choice(normalized_samples) * 100)
+        if not self.chug_pool:
+            await asyncio.shield(self.refill_chug_pool())
+        chug_time = int(self.chug_pool.pop() * 100)
+        if len(self.chug_pool) < CHUG_REFILL_AT:
+            self.refill_chug_pool()
         response = f"{ nickname} chugs {chug_time}% of their drink! 🍺😈"
-        await message.channel.send(response)
+        await self.bot.outbox.send(message.channel, response)
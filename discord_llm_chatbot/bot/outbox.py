@@ -0,0 +1,201 @@
+# bot/outbox.py
+import asyncio
+import logging
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from discord.abc import Messageable
+from discord.http import HTTPClient, Route
+from discord.message import Message
+
+from ..utils.metrics import metrics
+
+log = logging.getLogger("chatbot.replies")
+
+FENCE_PATTERN = re.compile(r"```(\w*)")
+# Room kept in each chunk for closing a code block that continues in the next
+FENCE_CLOSE = "\n```"
+# Preferred places to split, best first
+SEPARATORS = ("\n\n", "\n", " ")
+
+
+def split_message(text: str, limit: int) -> List[str]:
+    """Splits text into chunks of at most `limit` characters.
+
+    Chunks end at a paragraph, line or word boundary where one is near the
+    limit. A code block cut between chunks is closed at the end of one and
+    reopened, with its language, at the start of the next.
+    """
+    chunks = []
+    reopen = ""
+    rest = text
+    while rest:
+        if len(reopen) + len(rest) <= limit:
+            chunks.append(reopen + rest)
+            break
+
+        budget = limit - len(reopen) - len(FENCE_CLOSE)
+        cut, skip = budget, 0
+        for separator in SEPARATORS:
+            index = rest.rfind(separator, 0, budget)
+            # Don't settle for a boundary that leaves a tiny chunk
+            if index > budget // 2:
+                cut, skip = index, len(separator)
+                break
+        piece, rest = reopen + rest[:cut], rest[cut + skip :]
+
+        opening = None
+        for match in FENCE_PATTERN.finditer(piece):
+            opening = None if opening is not None else match.group(0)
+        if opening is not None:
+            piece += FENCE_CLOSE
+            reopen = opening + "\n"
+        else:
+            reopen = ""
+        chunks.append(piece)
+
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def rate_limit_delay(http: HTTPClient, channel_id: int) -> float:
+    """Returns seconds until the channel's message rate limit has room again.
+
+    Reads the bucket discord.py fills from the X-RateLimit headers of
+    earlier sends, so the outbox can wait (and coalesce meanwhile) rather
+    than queue requests inside discord.py's own backoff.
+    """
+    route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel_id)
+    bucket_hash = getattr(http, "_bucket_hashes", {}).get(route.key, route.key)
+    bucket = getattr(http, "_buckets", {}).get(
+        f"{bucket_hash}:{route.major_parameters}"
+    )
+    if bucket is None or bucket.remaining > 0 or bucket.expires is None:
+        return 0.0
+    return max(0.0, bucket.expires - asyncio.get_running_loop().time())
+
+
+class OutgoingMessage:
+    __slots__ = ("channel", "content", "reference", "coalesce", "future")
+
+    def __init__(
+        self,
+        channel: Messageable,
+        content: str,
+        reference: Optional[Message],
+        coalesce: bool,
+    ):
+        self.channel = channel
+        self.content = content
+        self.reference = reference
+        self.coalesce = coalesce
+        self.future: "asyncio.Future[List[Message]]" = (
+            asyncio.get_running_loop().create_future()
+        )
+
+    @property
+    def reference_id(self) -> Optional[int]:
+        return self.reference.id if self.reference is not None else None
+
+
+class Outbox:
+    """Delivers the bot's messages through one ordered queue per channel.
+
+    Messages are sent in the order they were queued. Short messages waiting
+    behind a send to the same target are coalesced into a single message,
+    long ones are split at natural boundaries, and sends wait out the
+    channel's rate limit instead of stalling in discord.py's backoff.
+    """
+
+    def __init__(self, http: HTTPClient, character_limit: int):
+        self.http = http
+        self.character_limit = character_limit
+        self.queues: Dict[int, Deque[OutgoingMessage]] = {}
+        self.workers: Dict[int, "asyncio.Task[None]"] = {}
+
+    async def send(
+        self,
+        channel: Messageable,
+        content: str,
+        reference: Optional[Message] = None,
+        coalesce: bool = True,
+    ) -> List[Message]:
+        """Queues `content` for the channel and waits until it is delivered.
+
+        Returns the messages the content was sent in. Pass `coalesce=False`
+        for messages that are edited later, so they hold only this content.
+        """
+        item = OutgoingMessage(channel, content, reference, coalesce)
+        self.queues.setdefault(channel.id, deque()).append(item)
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self.run(channel.id))
+        return await item.future
+
+    async def run(self, channel_id: int):
+        queue = self.queues[channel_id]
+        batch: List[OutgoingMessage] = []
+        try:
+            while queue:
+                # Messages queued while waiting out the rate limit join the batch
+                await self.pace(channel_id)
+                batch = self.take_batch(queue)
+                if len(batch) > 1:
+                    metrics.inc("discord_sends_coalesced_total", len(batch) - 1)
+                content = "\n".join(item.content for item in batch)
+                try:
+                    sent = await self.deliver(batch[0], content)
+                except Exception as e:
+                    log.warning("Failed to send to channel %s: %s", channel_id, e)
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+                else:
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_result(sent)
+        finally:
+            for item in (*batch, *queue):
+                item.future.cancel()
+            del self.queues[channel_id]
+            del self.workers[channel_id]
+
+    def take_batch(self, queue: Deque[OutgoingMessage]) -> List[OutgoingMessage]:
+        """Pops the next message plus any that can share its send."""
+        batch = [queue.popleft()]
+        if not batch[0].coalesce:
+            return batch
+
+        size = len(batch[0].content)
+        while queue:
+            item = queue[0]
+            size += 1 + len(item.content)
+            if (
+                not item.coalesce
+                or item.reference_id != batch[0].reference_id
+                or size > self.character_limit
+            ):
+                break
+            batch.append(queue.popleft())
+        return batch
+
+    async def deliver(self, item: OutgoingMessage, content: str) -> List[Message]:
+        sent = []
+        for i, chunk in enumerate(split_message(content, self.character_limit)):
+            if i:
+                await self.pace(item.channel.id)
+            with metrics.time("discord_send"):
+                sent.append(await item.channel.send(chunk, reference=item.reference))
+        return sent
+
+    async def pace(self, channel_id: int):
+        delay = rate_limit_delay(self.http, channel_id)
+        if delay:
+            metrics.inc("discord_sends_paced_total")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        """Cancels queued and in-flight sends."""
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,119 @@
+# bot/streaming.py
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from discord.abc import Messageable
+from discord.message import Message
+
+from ..utils.metrics import metrics
+from ..utils.text_processor import FEED_BATCH, ResponseCleaner
+from .outbox import Outbox, split_message
+
+# Splits a segment into leading whitespace, text and trailing whitespace
+SEGMENT_PATTERN = re.compile(r"(\s*)(.*?)(\s*)", re.DOTALL)
+
+
+class StreamingReply:
+    """Posts a reply while it is generated, editing Discord messages in place."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        channel: Messageable,
+        reference: Optional[Message],
+        character_limit: int,
+        first_chunk: int,
+        edit_interval: float,
+        transform: Callable[[str], str],
+    ):
+        self.outbox = outbox
+        self.channel = channel
+        self.reference = reference
+        self.character_limit = character_limit
+        self.first_chunk = first_chunk
+        self.edit_interval = edit_interval
+        self.transform = transform
+
+        # Every delta is cleaned until the first message is sent, so short
+        # replies reach the channel as soon as first_chunk allows
+        self.cleaner = ResponseCleaner(batch=0)
+        self.sent: List[Message] = []
+        self.shown: List[str] = []
+        self.last_flush = 0.0
+
+        # Cleaned text is transformed one whitespace-delimited segment at a
+        # time so earlier output stays stable between edits.
+        self.pending = ""
+        self.preview_parts: List[str] = []
+
+    async def feed(self, delta: str):
+        """Adds a streamed delta and flushes when the edit cadence allows."""
+        self.pending += self.cleaner.feed(delta)
+        preview = self.preview()
+        if not preview:
+            return
+
+        if not self.sent:
+            if len(preview) >= self.first_chunk:
+                await self.flush(preview)
+                self.cleaner.batch = FEED_BATCH
+        elif time.monotonic() - self.last_flush >= self.edit_interval:
+            await self.flush(preview)
+
+    def complete(self) -> Tuple[str, str]:
+        """Ends the stream, returning the clean text and the text to display."""
+        self.pending += self.cleaner.finish()
+        if self.pending:
+            self.preview_parts.append(self.transform_segment(self.pending))
+            self.pending = ""
+        return self.cleaner.text, "".join(self.preview_parts).strip()
+
+    async def finish(self, text: str):
+        """Replaces the preview with the final post-processed text."""
+        await self.flush(text)
+
+    def preview(self) -> str:
+        """Returns the displayable text for the completed part of the stream."""
+        boundary = max(self.pending.rfind(" "), self.pending.rfind("\n")) + 1
+        if boundary:
+            self.preview_parts.append(
+                self.transform_segment(self.pending[:boundary])
+            )
+            self.pending = self.pending[boundary:]
+        return "".join(self.preview_parts).strip()
+
+    def transform_segment(self, segment: str) -> str:
+        """Transforms a segment's text, keeping the whitespace around it as is.
+
+        uwuify pads text that ends in whitespace, which would otherwise add
+        up to a double space after every segment.
+        """
+        leading, text, trailing = SEGMENT_PATTERN.fullmatch(segment).groups()
+        if not text:
+            return segment
+        return leading + self.transform(text) + trailing
+
+    async def flush(self, text: str):
+        """Edits sent messages that changed and sends new ones for overflow."""
+        self.last_flush = time.monotonic()
+        chunks = split_message(text, self.character_limit)
+
+        for i, chunk in enumerate(chunks):
+            if i < len(self.sent):
+                if self.shown[i] != chunk:
+                    with metrics.time("discord_edit"):
+                        await self.sent[i].edit(content=chunk)
+                    self.shown[i] = chunk
+            else:
+                # Kept apart from other messages, since it is edited later
+                (sent,) = await self.outbox.send(
+                    self.channel, chunk, self.reference, coalesce=False
+                )
+                self.sent.append(sent)
+                self.shown.append(chunk)
+
+        # The final text can be shorter than the preview that was shown.
+        while len(self.sent) > len(chunks):
+            await self.sent.pop().delete()
+            self.shown.pop()
@@ -0,0 +1,85 @@
+# bot/summarizer.py
+import logging
+import time
+from typing import TYPE_CHECKING
+
+from ..utils.llm_limiter import PRIORITY_BACKGROUND
+from ..utils.metrics import metrics
+from ..utils.openai_client import DEFAULT_RESPONSE
+from .conversation_store import ChannelHistory
+
+if TYPE_CHECKING:
+    from .bot import MyBot
+
+log = logging.getLogger("chatbot.history")
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a Discord channel's conversation. Fold the "
+    "new messages into the current summary. Keep who said what, topics, facts "
+    "and open questions a later reply may need; drop greetings and small talk. "
+    "Reply with the updated summary only, in at most {words} words."
+)
+
+
+class HistorySummarizer:
+    """Folds history evicted from channels into per-channel summaries.
+
+    Runs as a background job and only touches channels that are idle and
+    have no reply in flight, so summarisation never delays a response.
+    """
+
+    def __init__(self, bot: "MyBot"):
+        self.bot = bot
+
+    async def run(self):
+        """Summarises every idle channel with evicted history waiting."""
+        cutoff = time.monotonic() - self.bot.config.SUMMARY_IDLE_SECONDS
+        scheduler = self.bot.message_handler.scheduler
+        for channel_id, history in list(self.bot.cache.channels.items()):
+            if (
+                history.evicted
+                and history.last_used < cutoff
+                and not scheduler.is_busy(channel_id)
+            ):
+                await self.summarize(history)
+
+    async def summarize(self, history: ChannelHistory):
+        """Folds the channel's evicted messages into its summary."""
+        batch = list(history.evicted)
+        generation = history.generation
+        transcript = "\n".join(
+            f"{message.author_name}: {message.content}" for message in batch
+        )
+        messages = [
+            {
+                "role": "system",
+                "content": SUMMARY_PROMPT.format(
+                    words=self.bot.config.SUMMARY_MAX_WORDS
+                ),
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{history.summary or '(none)'}\n\n"
+                f"New messages:\n{transcript}",
+            },
+        ]
+
+        with metrics.time("summarize"):
+            summary = await self.bot.message_handler.openai_client.send_message(
+                messages, PRIORITY_BACKGROUND
+            )
+        if summary == DEFAULT_RESPONSE:
+            # The request failed or was shed; try again on the next run
+            return
+        if history.generation != generation:
+            # Cleared while summarising; the summary covers forgotten history
+            return
+
+        history.set_summary(summary.strip(), batch[-1].seq)
+        metrics.inc("summaries_total")
+        log.info(
+            "Folded %d messages into the summary of channel %s",
+            len(batch),
+            history.channel_id,
+            extra={"channel_id": history.channel_id, "folded": len(batch)},
+        )
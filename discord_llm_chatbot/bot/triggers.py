@@ -0,0 +1,111 @@
+# bot/triggers.py
+import re
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Pattern
+
+from discord.message import Message
+
+MessageCommand = Callable[[Message], Awaitable[None]]
+
+# Marks the end of a word in a trie node
+END = ""
+
+
+def boundary(char: str, lookbehind: bool) -> str:
+    """Stops a match inside a word, on sides where the trigger is a word character.
+
+    The start check looks back past the first character, so the pattern
+    still begins with a literal that the regex engine can scan ahead for.
+    """
+    if not re.match(r"\w", char):
+        return ""
+    return r"(?<!\w.)" if lookbehind else r"(?!\w)"
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Builds one regex alternation shaped like a trie of `words`.
+
+    Words sharing a prefix share its branch, so a match attempt follows a
+    single path however many words there are. Each word only matches as a
+    whole word wherever it starts or ends with a word character.
+    """
+    trie: Dict[str, Any] = {}
+    for word in set(words):
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[END] = boundary(word[-1], lookbehind=False)
+
+    def node_pattern(node: Dict[str, Any]) -> str:
+        # Longer words are tried first, so a word never cuts a longer one short
+        branches = [
+            re.escape(char) + node_pattern(child)
+            for char, child in sorted(node.items())
+            if char != END
+        ]
+        if END in node:
+            branches.append(node[END])
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return "|".join(
+        re.escape(char) + boundary(char, lookbehind=True) + node_pattern(child)
+        for char, child in sorted(trie.items())
+    )
+
+
+def compile_words(words: Iterable[str]) -> Optional[Pattern[str]]:
+    """Compiles `words` into one pattern, or returns None if there are none."""
+    pattern = trie_pattern(words)
+    return re.compile(pattern) if pattern else None
+
+
+class TriggerEngine:
+    """Decides which messages run a command or trigger a keyword reply.
+
+    Command prefixes and each channel's reply keywords are compiled into a
+    single pattern apiece when the bot starts, so checking a message takes
+    one regex pass however many triggers are configured. Channels listed
+    in `channel_keywords` use their own keywords instead of the defaults.
+    """
+
+    def __init__(
+        self,
+        commands: Dict[str, MessageCommand],
+        keywords: List[str],
+        channel_keywords: Dict[int, List[str]],
+        designated_channels: Iterable[int],
+    ):
+        self.commands = commands
+        self.command_pattern = compile_words(commands)
+        self.designated = frozenset(designated_channels)
+        # Keywords match case-insensitively against lowercased messages, which
+        # is much faster than an IGNORECASE pattern
+        self.keyword_pattern = compile_words(word.lower() for word in keywords)
+        self.channel_patterns = {
+            channel_id: compile_words(word.lower() for word in words)
+            for channel_id, words in channel_keywords.items()
+        }
+        # Every keyword in use, in any channel
+        self.keywords = {
+            word.lower()
+            for words in (keywords, *channel_keywords.values())
+            for word in words
+        }
+
+    def command(self, content: str) -> Optional[MessageCommand]:
+        """Returns the command a message starts with, if any."""
+        if self.command_pattern is None:
+            return None
+        match = self.command_pattern.match(content)
+        return self.commands[match.group(0)] if match else None
+
+    def is_designated(self, channel_id: int) -> bool:
+        return channel_id in self.designated
+
+    def has_keyword(self, channel_id: int, content: str) -> bool:
+        """Checks a designated channel's message for a reply keyword."""
+        pattern = self.channel_patterns.get(channel_id, self.keyword_pattern)
+        return pattern is not None and pattern.search(content.lower()) is not None
@@ -1,11 +1,23 @@
 # config/config.py
+import json
 import os
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List
 
 from dotenv import load_dotenv
 
 
+@dataclass
+class LLMBackend:
+    """An OpenAI-compatible endpoint and model that replies can be routed to."""
+
+    name: str
+    model: str
+    base_url: str = ""  # Blank for the OpenAI API
+    api_key: str = ""  # Blank to use OPENAI_API_KEY
+    timeout: float = 60.0
+
+
 @dataclass
 class Config:
     DISCORD_TOKEN: str
@@ -19,10 +31,127 @@ class Config:
     # Bot specific configs
     ACTIVITY_TIMER: int = 300
     DISCORD_CHARACTER_LIMIT: int = 2000
-    MESSAGE_THRESHOLD: int = 5000
-    SEND_LIMIT: int = 10000
     MAX_CACHED_IMAGES: int = 10
 
+    # Words that trigger replies in designated channels, once their history
+    # passes MESSAGE_THRESHOLD; a channel listed per channel uses its own list
+    REPLY_KEYWORDS: List[str] = field(default_factory=list)
+    CHANNEL_REPLY_KEYWORDS: Dict[int, List[str]] = field(default_factory=dict)
+
+    # Token budgets
+    MESSAGE_THRESHOLD: int = 1250  # History tokens before keyword replies
+    CONTEXT_TOKEN_LIMIT: int = 3000  # Prompt plus reply tokens per request
+    REPLY_TOKEN_RESERVE: int = 500
+    IMAGE_TOKEN_COST: int = 85
+    PROMPT_TRIM_RATIO: float = 0.6  # Share of the budget kept when history is trimmed
+    DEFAULT_CONTEXT_WINDOW: int = 8192
+    MODEL_CONTEXT_WINDOWS: Dict[str, int] = field(
+        default_factory=lambda: {"gpt-4o-mini": 128000, "gpt-4o": 128000}
+    )
+
+    # Conversation cache memory limits (0 disables a limit)
+    CHANNEL_TOKEN_LIMIT: int = 3000  # History tokens kept per channel
+    CHANNEL_MESSAGE_LIMIT: int = 200  # History messages kept per channel
+    CACHE_MEMORY_BUDGET: int = 64 * 1024 * 1024  # Bytes across all channels
+    CHANNEL_IDLE_TIMEOUT: float = 6 * 60 * 60  # Idle seconds before eviction
+    CHANNEL_IDLE_CHECK_INTERVAL: float = 300.0
+
+    # Background summaries of evicted history (SUMMARY_MAX_EVICTED 0 disables them)
+    SUMMARY_MAX_EVICTED: int = 100  # Evicted messages held for the next summary
+    SUMMARY_MAX_WORDS: int = 150
+    SUMMARY_IDLE_SECONDS: float = 30.0  # Channel quiet time before summarising
+    SUMMARY_INTERVAL: float = 15.0
+
+    # LLM client configs
+    LLM_TIMEOUT: float = 60.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 10.0
+    LLM_MAX_IN_FLIGHT: int = 8
+    LLM_MAX_QUEUE: int = 32
+    LLM_RATE_LIMIT: float = 5.0  # Requests per second (0 disables pacing)
+    LLM_RATE_BURST: int = 10
+
+    # Model routing: backends in order of preference. Left empty, a single
+    # backend is built from LOCAL_CLIENT_URL, MODEL_NAME and LLM_TIMEOUT.
+    LLM_BACKENDS: List[LLMBackend] = field(default_factory=list)
+    LLM_BACKEND_WINDOW: int = 50  # Recent requests used for health stats
+    LLM_BACKEND_MAX_ERROR_RATE: float = 0.5
+    LLM_BACKEND_COOLDOWN: float = 30.0  # Seconds a failing backend is skipped
+    # Send a second request to the next backend once the first is slower
+    # than this quantile of its recent latency
+    LLM_HEDGE: bool = False
+    LLM_HEDGE_QUANTILE: float = 0.95
+
+    # Ask LOCAL_CLIENT_URL servers (llama.cpp style) to reuse cached prompt prefixes
+    PROMPT_CACHE_HINTS: bool = False
+
+    # Seconds to collect triggers that arrive during a reply into one follow-up
+    REPLY_DEBOUNCE: float = 1.0
+
+    # Logging configs: levels per logger, e.g. {"chatbot.messages": "WARNING"}
+    LOG_FILE: str = "discord.log"
+    LOG_LEVELS: Dict[str, str] = field(default_factory=dict)
+    # Fraction of incoming messages logged (warnings are always kept)
+    MESSAGE_LOG_SAMPLE_RATE: float = 1.0
+    # Fraction of prompt payloads logged for debugging (0 disables them)
+    PROMPT_LOG_SAMPLE_RATE: float = 0.0
+
+    # Streaming configs
+    STREAM_RESPONSES: bool = True
+    STREAM_FIRST_CHUNK: int = 20
+    STREAM_EDIT_INTERVAL: float = 1.0
+
+    # Image validation configs
+    IMAGE_HTTP_CONNECTIONS: int = 20
+    IMAGE_DNS_CACHE_TTL: int = 300
+    IMAGE_VALIDATION_TIMEOUT: float = 3.0
+    IMAGE_CACHE_SIZE: int = 1024
+    IMAGE_CACHE_TTL: float = 3600.0
+
+    # Image preprocessing (needs Pillow): images are fetched once, downscaled
+    # and sent inline instead of as Discord URLs
+    IMAGE_PREPROCESS: bool = True
+    IMAGE_MAX_SIDE: int = 768  # Longest side in pixels after downscaling
+    IMAGE_QUALITY: int = 80  # JPEG quality of the re-encoded image
+    IMAGE_DETAIL: str = "low"  # Vision detail level: low, high or auto
+    IMAGE_FETCH_TIMEOUT: float = 10.0
+    IMAGE_MAX_DOWNLOAD: int = 20 * 1024 * 1024  # Larger images are skipped
+    IMAGE_MEMORY_CACHE_BYTES: int = 32 * 1024 * 1024
+    IMAGE_DISK_CACHE_DIR: str = ""  # Blank keeps processed images in memory only
+    IMAGE_DISK_CACHE_BYTES: int = 512 * 1024 * 1024
+
+    # Prometheus metrics endpoint (port 0 disables it)
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 0
+
+    # Sharding configs: SHARD_COUNT 0 uses Discord's recommended count, and
+    # SHARD_WORKERS > 1 splits the shards across processes sharing HISTORY_DB_PATH
+    SHARD_COUNT: int = 0
+    SHARD_WORKERS: int = 1
+
+    # Persistence configs (leave HISTORY_DB_PATH blank to keep history in memory only)
+    HISTORY_DB_PATH: str = ""
+    PERSISTENCE_BATCH_SIZE: int = 100
+    PERSISTENCE_FLUSH_INTERVAL: float = 1.0
+    PERSISTENCE_READ_TIMEOUT: float = 30.0  # Seconds before a history read fails
+
+    # Append sanitised incoming traffic to this JSONL file for benchmarks/replay.py
+    TRAFFIC_RECORD_PATH: str = ""
+    TRAFFIC_RECORD_SALT: str = ""  # Keeps pseudonyms stable; blank picks one per run
+    TRAFFIC_RECORD_FLUSH_INTERVAL: float = 5.0  # Seconds between writes to the file
+
+
+def parse_log_levels(value: str) -> Dict[str, str]:
+    """Parses "logger=LEVEL" pairs separated by commas."""
+    levels = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            name, level = pair.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
 
 def load_config() -> Config:
     try:
@@ -39,10 +168,41 @@ def load_config() -> Config:
                 for channel in os.getenv("DESIGNATED_CHANNELS").split(",")
                 if channel.strip()
             ],
+            REPLY_KEYWORDS=[
+                word.strip()
+                for word in os.getenv("REPLY_KEYWORDS", "").split(",")
+                if word.strip()
+            ],
+            CHANNEL_REPLY_KEYWORDS={
+                int(channel): words
+                for channel, words in json.loads(
+                    os.getenv("CHANNEL_REPLY_KEYWORDS") or "{}"
+                ).items()
+            },
             GUILD_TEST_ID=os.getenv("GUILD_TEST_ID"),
             OWNER_ID=os.getenv("OWNER_ID"),
             LOCAL_CLIENT_URL=os.getenv("LOCAL_CLIENT_URL", ""),
             MODEL_NAME=os.getenv("MODEL_NAME"),
+            HISTORY_DB_PATH=os.getenv("HISTORY_DB_PATH", ""),
+            METRICS_PORT=int(os.getenv("METRICS_PORT") or 0),
+            TRAFFIC_RECORD_PATH=os.getenv("TRAFFIC_RECORD_PATH", ""),
+            TRAFFIC_RECORD_SALT=os.getenv("TRAFFIC_RECORD_SALT", ""),
+            IMAGE_PREPROCESS=(os.getenv("IMAGE_PREPROCESS") or "true").lower()
+            in ("1", "true", "yes"),
+            IMAGE_DETAIL=os.getenv("IMAGE_DETAIL") or "low",
+            IMAGE_DISK_CACHE_DIR=os.getenv("IMAGE_DISK_CACHE_DIR", ""),
+            LLM_BACKENDS=[
+                LLMBackend(**backend)
+                for backend in json.loads(os.getenv("LLM_BACKENDS") or "[]")
+            ],
+            LLM_HEDGE=os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+            PROMPT_CACHE_HINTS=os.getenv("PROMPT_CACHE_HINTS", "").lower()
+            in ("1", "true", "yes"),
+            SHARD_COUNT=int(os.getenv("SHARD_COUNT") or 0),
+            SHARD_WORKERS=int(os.getenv("SHARD_WORKERS") or 1),
+            LOG_LEVELS=parse_log_levels(os.getenv("LOG_LEVELS", "")),
+            MESSAGE_LOG_SAMPLE_RATE=float(os.getenv("MESSAGE_LOG_SAMPLE_RATE") or 1.0),
+            PROMPT_LOG_SAMPLE_RATE=float(os.getenv("PROMPT_LOG_SAMPLE_RATE") or 0.0),
         )
     except (KeyError, AttributeError) as e:
         raise ValueError(f"Missing required environment variables: {str(e)}")
@@ -1,30 +1,195 @@
 # main.py
 import asyncio
+import multiprocessing
+import os
+import time
+from dataclasses import replace
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional
+
+import httpx
 
 from .bot.bot import MyBot
-from .config.config import load_config
+from .config.config import Config, load_config
 from .utils.logger import setup_logger
 
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
 
-def main():
-    # Setup logging
-    logger = setup_logger()
+# A crashed shard worker is restarted after a delay that doubles with each
+# crash in a row, and given up on after WORKER_MAX_CRASHES. A worker that
+# ran for WORKER_STABLE_SECONDS starts counting afresh.
+WORKER_RESTART_DELAY = 5.0
+WORKER_RESTART_MAX_DELAY = 300.0
+WORKER_MAX_CRASHES = 5
+WORKER_STABLE_SECONDS = 600.0
+WORKER_SHUTDOWN_TIMEOUT = 30.0
 
-    # Load configuration
-    config = load_config()
+
+async def run_bot(bot: MyBot, token: str):
+    # The context manager closes the bot on the same loop that started it,
+    # so pooled connections are torn down cleanly.
+    async with bot:
+        await bot.start(token)
+
+
+def run(config: Config, shard_ids: Optional[List[int]] = None):
+    """Runs one bot process, owning `shard_ids` or every shard."""
+    # Setup logging
+    logger = setup_logger(
+        config.LOG_LEVELS,
+        config.MESSAGE_LOG_SAMPLE_RATE,
+        config.PROMPT_LOG_SAMPLE_RATE,
+        config.LOG_FILE,
+    )
 
     # Initialize and run bot
-    bot = MyBot(config)
+    bot = MyBot(config, shard_ids)
 
     try:
-        asyncio.run(bot.start(config.DISCORD_TOKEN))
+        asyncio.run(run_bot(bot, config.DISCORD_TOKEN))
     except KeyboardInterrupt:
         logger.info("Bot shutdown initiated")
     except Exception as e:
-        logger.error(f"Error running bot: {e}")
+        logger.exception("Error running bot: %s", e)
         raise
+
+
+def run_worker(worker: int, shard_ids: List[int], shard_count: int):
+    """Entry point of a shard worker process."""
+    config = load_config()
+    name, ext = os.path.splitext(config.LOG_FILE)
+    record_name, record_ext = os.path.splitext(config.TRAFFIC_RECORD_PATH)
+    config = replace(
+        config,
+        SHARD_COUNT=shard_count,
+        # Each worker gets its own log file, traffic recording and metrics port
+        LOG_FILE=f"{name}.worker{worker}{ext}",
+        TRAFFIC_RECORD_PATH=(
+            f"{record_name}.worker{worker}{record_ext}"
+            if config.TRAFFIC_RECORD_PATH
+            else ""
+        ),
+        METRICS_PORT=config.METRICS_PORT + worker if config.METRICS_PORT else 0,
+    )
+    run(config, shard_ids)
+
+
+def recommended_shard_count(token: str) -> int:
+    """Asks Discord how many shards the bot should use."""
+    response = httpx.get(
+        GATEWAY_BOT_URL, headers={"Authorization": f"Bot {token}"}, timeout=10.0
+    )
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def launch_workers(config: Config):
+    """Splits the shards across worker processes and restarts any that crash.
+
+    Discord routes each guild's events to a single shard, so every channel
+    is served by one worker. Workers share history and reply claims through
+    HISTORY_DB_PATH, so a channel keeps its memory when shards move between
+    workers and a message is never answered twice.
+    """
+    logger = setup_logger(path=config.LOG_FILE)
+    if not config.HISTORY_DB_PATH:
+        logger.warning("HISTORY_DB_PATH is not set; shard workers will not share state")
+
+    shard_count = config.SHARD_COUNT
+    if not shard_count:
+        try:
+            shard_count = recommended_shard_count(config.DISCORD_TOKEN)
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning("Could not fetch the recommended shard count: %s", e)
+        # Every worker needs at least one shard
+        shard_count = max(shard_count, config.SHARD_WORKERS)
+    num_workers = min(config.SHARD_WORKERS, shard_count)
+    if config.TRAFFIC_RECORD_PATH and not config.TRAFFIC_RECORD_SALT:
+        # Workers read their config from the environment; sharing one salt
+        # gives a user the same pseudonym in every worker's recording
+        os.environ["TRAFFIC_RECORD_SALT"] = os.urandom(16).hex()
+    context = multiprocessing.get_context("spawn")
+
+    def spawn(worker: int) -> multiprocessing.Process:
+        shard_ids = list(range(worker, shard_count, num_workers))
+        process = context.Process(
+            target=run_worker,
+            args=(worker, shard_ids, shard_count),
+            name=f"shard-worker-{worker}",
+        )
+        process.start()
+        logger.info("Started worker %d with shards %s", worker, shard_ids)
+        return process
+
+    workers: Dict[int, multiprocessing.Process] = {}
+    started: Dict[int, float] = {}
+    crashes: Dict[int, int] = {worker: 0 for worker in range(num_workers)}
+    # Crashed workers waiting to be restarted, and when
+    restarts: Dict[int, float] = {}
+
+    def start(worker: int):
+        workers[worker] = spawn(worker)
+        started[worker] = time.monotonic()
+
+    for worker in range(num_workers):
+        start(worker)
+    try:
+        while workers or restarts:
+            now = time.monotonic()
+            for worker, restart_at in list(restarts.items()):
+                if restart_at <= now:
+                    del restarts[worker]
+                    start(worker)
+            timeout = max(0.0, min(restarts.values()) - now) if restarts else None
+            wait([process.sentinel for process in workers.values()], timeout)
+
+            for worker, process in list(workers.items()):
+                if process.exitcode is None:
+                    continue
+                del workers[worker]
+                if process.exitcode == 0:
+                    continue
+                if time.monotonic() - started[worker] >= WORKER_STABLE_SECONDS:
+                    crashes[worker] = 0
+                crashes[worker] += 1
+                if crashes[worker] >= WORKER_MAX_CRASHES:
+                    logger.error(
+                        "Worker %d exited with code %d %d times in a row, giving up",
+                        worker,
+                        process.exitcode,
+                        crashes[worker],
+                    )
+                    continue
+                delay = min(
+                    WORKER_RESTART_MAX_DELAY,
+                    WORKER_RESTART_DELAY * 2 ** (crashes[worker] - 1),
+                )
+                logger.error(
+                    "Worker %d exited with code %d, restarting in %.0fs",
+                    worker,
+                    process.exitcode,
+                    delay,
+                )
+                restarts[worker] = time.monotonic() + delay
+    except KeyboardInterrupt:
+        logger.info("Bot shutdown initiated")
     finally:
-        asyncio.run(bot.close())
+        # Workers receive the same Ctrl-C and close themselves; give them time
+        for process in workers.values():
+            process.join(WORKER_SHUTDOWN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+def main():
+    # Load configuration
+    config = load_config()
+
+    if config.SHARD_WORKERS > 1:
+        launch_workers(config)
+    else:
+        run(config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+# utils/image_processor.py
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import io
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from ..config.config import Config
+from .image_validator import ImageValidator
+from .metrics import metrics
+from .ttl_cache import TTLCache
+
+log = logging.getLogger("chatbot.images")
+
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+def pillow_available() -> bool:
+    """Checks for Pillow without paying for its import at startup."""
+    return importlib.util.find_spec("PIL") is not None
+
+
+def retrieve_exception(task: "asyncio.Task[Optional[str]]"):
+    """Marks a background task's error as handled, logging it instead."""
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("Error preparing image: %s", task.exception())
+
+
+def url_key(url: str) -> str:
+    """Strips the expiring signature Discord adds to attachment URLs."""
+    return url.split("?", 1)[0]
+
+
+def encode_image(data: bytes, max_side: int, quality: int) -> bytes:
+    """Downscales an image to fit `max_side` and re-encodes it as JPEG.
+
+    Raises an error from Pillow if the data is not a readable image.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as image:
+        # Lets JPEG decoding skip straight to a reduced size
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Flatten transparency onto white rather than black
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side))
+
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True)
+        return output.getvalue()
+
+
+class ImageProcessor:
+    """Fetches images once and turns them into compact inline data URLs.
+
+    Processed images are content-addressed by a hash of the downloaded bytes
+    and the processing settings, so the same picture posted twice is stored
+    once. They are kept in a memory cache bounded in bytes and, optionally,
+    in a directory bounded in size that survives restarts.
+    """
+
+    def __init__(self, config: Config, validator: ImageValidator):
+        self.config = config
+        # Shares the validator's HTTP session and connection pool
+        self.validator = validator
+        self.timeout = aiohttp.ClientTimeout(total=config.IMAGE_FETCH_TIMEOUT)
+        self.settings = f"{config.IMAGE_MAX_SIDE}:{config.IMAGE_QUALITY}".encode()
+        # Attachment URL (without its signature) to the digest of its image
+        self.digests: TTLCache[str] = TTLCache(
+            config.IMAGE_CACHE_SIZE, config.IMAGE_CACHE_TTL
+        )
+        self.images: "OrderedDict[str, str]" = OrderedDict()
+        self.image_bytes = 0
+        self.pending: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+        self.directory = config.IMAGE_DISK_CACHE_DIR
+        if self.directory:
+            os.makedirs(os.path.join(self.directory, "urls"), exist_ok=True)
+
+    async def prepare(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        """Returns a data URL for each image URL, or None for invalid images.
+
+        Images still being fetched at the deadline, or that could not be
+        processed, map to their original URL. Late fetches finish in the
+        background for later replies.
+        """
+        results: Dict[str, Optional[str]] = {}
+        tasks: Dict[str, "asyncio.Task[Optional[str]]"] = {}
+        for url in urls:
+            cached = self.cached(url)
+            if cached is not None:
+                metrics.inc("image_cache_hits_total")
+                results[url] = cached
+            elif url not in tasks:
+                tasks[url] = self.fetch(url)
+
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=self.config.IMAGE_FETCH_TIMEOUT)
+            for url, task in tasks.items():
+                if not task.done():
+                    # Nobody awaits the late fetch, so its error is retrieved
+                    # here rather than logged as never retrieved
+                    task.add_done_callback(retrieve_exception)
+                    results[url] = url
+                else:
+                    results[url] = task.result()
+        return results
+
+    def cached(self, url: str) -> Optional[str]:
+        digest = self.digests.get(url_key(url))
+        if digest is None or digest not in self.images:
+            return None
+        self.images.move_to_end(digest)
+        return self.images[digest]
+
+    def fetch(self, url: str) -> "asyncio.Task[Optional[str]]":
+        task = self.pending.get(url)
+        if task is None:
+            task = self.pending[url] = asyncio.create_task(self.load(url))
+            task.add_done_callback(lambda _: self.pending.pop(url, None))
+        return task
+
+    async def load(self, url: str) -> Optional[str]:
+        """Returns the image's data URL, from disk or by downloading it."""
+        key = url_key(url)
+        if self.directory:
+            stored = await asyncio.to_thread(self.read_disk, key)
+            if stored is not None:
+                metrics.inc("image_disk_hits_total")
+                digest, encoded = stored
+                return self.remember(key, digest, encoded)
+
+        metrics.inc("image_cache_misses_total")
+        with metrics.time("image_fetch"):
+            data = await self.download(url)
+        if data is None:
+            return None
+
+        digest = hashlib.sha256(self.settings + data).hexdigest()
+        with metrics.time("image_encode"):
+            try:
+                encoded = await asyncio.to_thread(
+                    encode_image,
+                    data,
+                    self.config.IMAGE_MAX_SIDE,
+                    self.config.IMAGE_QUALITY,
+                )
+            except Exception as e:
+                # e.g. a format Pillow can't read; the model may still manage
+                log.warning("Error processing image: %s, %s", url, e)
+                return url
+
+        if self.directory:
+            await asyncio.to_thread(self.write_disk, key, digest, encoded)
+        return self.remember(key, digest, encoded)
+
+    async def download(self, url: str) -> Optional[bytes]:
+        """Downloads an image, or returns None if it is missing or too big."""
+        await self.validator.start()
+        limit = self.config.IMAGE_MAX_DOWNLOAD
+        try:
+            async with self.validator.session.get(
+                url, timeout=self.timeout
+            ) as response:
+                content_type = response.headers.get("Content-Type", "")
+                if response.status != 200 or not content_type.startswith("image/"):
+                    return None
+                if (response.content_length or 0) > limit:
+                    return None
+                data = bytearray()
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK):
+                    data += chunk
+                    if len(data) > limit:
+                        return None
+                return bytes(data)
+        except Exception as e:
+            log.warning("Error fetching image: %s, %s", url, e)
+            return None
+
+    def remember(self, key: str, digest: str, encoded: bytes) -> str:
+        """Caches a processed image in memory and returns its data URL."""
+        self.digests.set(key, digest)
+        data_url = self.images.get(digest)
+        if data_url is None:
+            data_url = "data:image/jpeg;base64," + base64.b64encode(encoded).decode()
+            self.images[digest] = data_url
+            self.image_bytes += len(data_url)
+            while self.image_bytes > self.config.IMAGE_MEMORY_CACHE_BYTES:
+                _, evicted = self.images.popitem(last=False)
+                self.image_bytes -= len(evicted)
+        return data_url
+
+    def url_path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, "urls", name)
+
+    def image_path(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def read_disk(self, key: str) -> Optional[Tuple[str, bytes]]:
+        try:
+            with open(self.url_path(key)) as f:
+                digest = f.read().strip()
+            with open(self.image_path(digest), "rb") as f:
+                return digest, f.read()
+        except OSError:
+            return None
+
+    def write_disk(self, key: str, digest: str, encoded: bytes):
+        try:
+            path = self.image_path(digest)
+            if not os.path.exists(path):
+                # Write then rename, so readers never see a partial file
+                with open(f"{path}.tmp", "wb") as f:
+                    f.write(encoded)
+                os.replace(f"{path}.tmp", path)
+            with open(self.url_path(key), "w") as f:
+                f.write(digest)
+        except OSError as e:
+            log.warning("Error writing image cache: %s", e)
+
+    async def prune(self):
+        """Drops expired URL mappings and trims the disk cache to its budget."""
+        self.digests.purge_expired()
+        if self.directory:
+            await asyncio.to_thread(self.prune_disk)
+
+    def prune_disk(self):
+        """Deletes the least recently written files over the disk budget."""
+        entries = []
+        for folder in (self.directory, os.path.join(self.directory, "urls")):
+            with os.scandir(folder) as it:
+                entries.extend(entry for entry in it if entry.is_file())
+        stats = sorted(
+            ((entry.stat(), entry.path) for entry in entries),
+            key=lambda item: item[0].st_mtime,
+        )
+        total = sum(stat.st_size for stat, _ in stats)
+        removed = 0
+        for stat, path in stats:
+            if total <= self.config.IMAGE_DISK_CACHE_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= stat.st_size
+            removed += 1
+        if removed:
+            log.info("Pruned %d files from the image cache", removed)
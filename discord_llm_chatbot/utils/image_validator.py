@@ -0,0 +1,104 @@
+# utils/image_validator.py
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from ..config.config import Config
+from .ttl_cache import TTLCache
+
+log = logging.getLogger("chatbot.images")
+
+
+class ImageValidator:
+    """Checks that image URLs are reachable, sharing one HTTP session."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.cache: TTLCache[bool] = TTLCache(
+            config.IMAGE_CACHE_SIZE, config.IMAGE_CACHE_TTL
+        )
+        # Checks in flight, so the same URL posted twice is only requested once.
+        self.pending: Dict[str, "asyncio.Task[bool]"] = {}
+
+    async def start(self):
+        """Opens the shared HTTP session."""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.config.IMAGE_HTTP_CONNECTIONS,
+                    ttl_dns_cache=self.config.IMAGE_DNS_CACHE_TTL,
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=self.config.IMAGE_VALIDATION_TIMEOUT
+                ),
+            )
+
+    async def close(self):
+        """Closes the shared HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def purge_expired(self):
+        """Drops expired results so idle URLs don't hold cache slots."""
+        self.cache.purge_expired()
+
+    async def validate(self, urls: List[str]) -> List[str]:
+        """Returns the URLs that point at accessible images, in order.
+
+        All checks run concurrently; any that miss the deadline count as
+        invalid.
+        """
+        if not urls:
+            return []
+
+        results: Dict[str, bool] = {}
+        tasks: Dict[str, "asyncio.Task[bool]"] = {}
+        for url in urls:
+            cached = self.cache.get(url)
+            if cached is not None:
+                results[url] = cached
+            elif url not in tasks:
+                tasks[url] = self.check(url)
+
+        if tasks:
+            await asyncio.wait(
+                tasks.values(), timeout=self.config.IMAGE_VALIDATION_TIMEOUT
+            )
+            for url, task in tasks.items():
+                results[url] = (
+                    task.done() and not task.cancelled() and task.result()
+                )
+
+        return [url for url in urls if results[url]]
+
+    async def is_valid(self, url: str) -> bool:
+        """Check if the given image URL is valid and accessible."""
+        return bool(await self.validate([url]))
+
+    def check(self, url: str) -> "asyncio.Task[bool]":
+        task = self.pending.get(url)
+        if task is None:
+            task = self.pending[url] = asyncio.create_task(self.head(url))
+            task.add_done_callback(lambda _: self.pending.pop(url, None))
+        return task
+
+    async def head(self, url: str) -> bool:
+        await self.start()
+        valid = False
+        try:
+            async with self.session.head(url, allow_redirects=True) as response:
+                # Ensure status is OK and the content type starts with "image/"
+                if response.status == 200:
+                    content_type = response.headers.get("Content-Type", "")
+                    valid = content_type.startswith("image/")
+        except Exception as e:
+            log.warning("Error validating image URL: %s, %s", url, e)
+            # Don't remember transient failures
+            return False
+
+        self.cache.set(url, valid)
+        return valid
@@ -0,0 +1,73 @@
+# utils/jobs.py
+import asyncio
+import logging
+import random
+from typing import Awaitable, Callable, Dict
+
+from .metrics import metrics
+
+log = logging.getLogger("chatbot.jobs")
+
+Job = Callable[[], Awaitable[None]]
+
+
+class JobScheduler:
+    """Runs periodic jobs as tasks on the bot's event loop.
+
+    Each job has a unique name and at most one running instance, so
+    scheduling it again (e.g. from `on_ready` after a reconnect) is a no-op.
+    A run never overlaps the previous one, and a failing run is logged
+    without stopping the job.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, "asyncio.Task[None]"] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.tasks
+
+    def schedule(
+        self,
+        name: str,
+        interval: float,
+        job: Job,
+        jitter: float = 0.0,
+        run_immediately: bool = False,
+    ):
+        """Runs `job` every `interval` plus up to `jitter` seconds."""
+        if name in self.tasks:
+            return
+        self.tasks[name] = asyncio.create_task(
+            self.run(name, interval, job, jitter, run_immediately), name=f"job-{name}"
+        )
+
+    async def run(
+        self, name: str, interval: float, job: Job, jitter: float, run_immediately: bool
+    ):
+        try:
+            if not run_immediately:
+                await asyncio.sleep(interval + random.uniform(0, jitter))
+            while True:
+                try:
+                    with metrics.time(f"job_{name}"):
+                        await job()
+                except Exception as e:
+                    metrics.inc("job_errors_total")
+                    log.exception("Error running job %s: %s", name, e)
+                await asyncio.sleep(interval + random.uniform(0, jitter))
+        finally:
+            if self.tasks.get(name) is asyncio.current_task():
+                del self.tasks[name]
+
+    def cancel(self, name: str):
+        task = self.tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        """Cancels every job and waits for running ones to stop."""
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,101 @@
+# utils/llm_limiter.py
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Tuple
+
+# Lower values are served first
+PRIORITY_MENTION = 0
+PRIORITY_KEYWORD = 1
+PRIORITY_BACKGROUND = 2
+
+
+class TokenBucket:
+    """Paces requests to `rate` per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def take(self):
+        """Waits until a request may be sent."""
+        if self.rate <= 0:
+            return
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # Reserve a token up front so concurrent callers queue behind each other
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class LLMLimiter:
+    """Admission control for LLM requests.
+
+    Caps the number of requests in flight, serves waiting requests in
+    priority order, and turns requests away once the wait queue is full so
+    callers can answer immediately instead of timing out.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, rate: float, burst: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.waiters: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self.counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self.waiters if not waiter.done())
+
+    async def acquire(self, priority: int) -> bool:
+        """Waits for a slot, returning False if the request was shed."""
+        if self.in_flight < self.max_in_flight and not self.queued:
+            self.in_flight += 1
+            return True
+        if self.queued >= self.max_queue:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        """Frees a slot, handing it to the highest-priority waiter."""
+        self.in_flight -= 1
+        while self.waiters:
+            _, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+                break
+
+    async def pace(self):
+        """Waits for the rate limit before sending a request."""
+        await self.bucket.take()
+
+    @asynccontextmanager
+    async def slot(self, priority: int) -> AsyncIterator[bool]:
+        """Holds a slot for the duration of the block, yielding whether admitted."""
+        if not await self.acquire(priority):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.release()
@@ -1,15 +1,134 @@
 # utils/logger.py
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Dict, Optional
 
+# Loggers for each category live under this namespace, e.g. "chatbot.messages"
+ROOT_LOGGER = "chatbot"
 
-def setup_logger() -> logging.Logger:
-    logger = logging.getLogger("discord")
-    logger.setLevel(logging.INFO)
+DEFAULT_LEVELS = {
+    "chatbot": "INFO",
+    "chatbot.messages": "INFO",
+    "chatbot.prompts": "INFO",
+    "discord": "INFO",
+}
 
-    handler = logging.FileHandler(filename="discord.log", encoding="utf-8", mode="w")
-    handler.setFormatter(
+# Attributes every LogRecord has; anything else was passed through `extra`
+RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def snapshot(value: Any) -> Any:
+    """Copies a log argument into plain values the event loop can't mutate.
+
+    Other objects, such as discord.py models, are converted with `str`, which
+    is what a %s placeholder would have shown.
+    """
+    if isinstance(value, PLAIN_TYPES):
+        return value
+    if isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(snapshot(item) for item in value)
+    if isinstance(value, (list, set)):
+        return [snapshot(item) for item in value]
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through a random `rate` fraction of records below WARNING."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """Enqueues records unformatted so formatting happens on the listener thread.
+
+    Arguments and `extra` fields are snapshotted first, since the objects they
+    refer to may change before the listener gets to them.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        if record.args:
+            record.args = snapshot(record.args)
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not isinstance(value, PLAIN_TYPES):
+                setattr(record, key, snapshot(value))
+        return record
+
+
+def setup_logger(
+    levels: Optional[Dict[str, str]] = None,
+    message_sample_rate: float = 1.0,
+    prompt_sample_rate: float = 0.0,
+    path: str = "discord.log",
+) -> logging.Logger:
+    """Routes bot and discord.py logs through a queue to a background writer.
+
+    The event loop only enqueues records; a listener thread formats them as
+    JSON lines into the log file and as plain text on stderr.
+    """
+    file_handler = RotatingFileHandler(
+        path, encoding="utf-8", maxBytes=10 * 1024 * 1024, backupCount=5
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(
         logging.Formatter("%(asctime)s:%(levelname)s:%(name)s: %(message)s")
     )
 
-    logger.addHandler(handler)
-    return logger
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    listener = QueueListener(records, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = BackgroundQueueHandler(records)
+    for name in (ROOT_LOGGER, "discord"):
+        logger = logging.getLogger(name)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+
+    for name, level in {**DEFAULT_LEVELS, **(levels or {})}.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    # Sampling runs on the calling thread, before a record is ever enqueued
+    logging.getLogger(f"{ROOT_LOGGER}.messages").addFilter(
+        SamplingFilter(message_sample_rate)
+    )
+    logging.getLogger(f"{ROOT_LOGGER}.prompts").addFilter(
+        SamplingFilter(prompt_sample_rate)
+    )
+
+    return logging.getLogger(ROOT_LOGGER)
@@ -0,0 +1,170 @@
+# utils/metrics.py
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+
+# Upper bounds in seconds, spanning in-memory work up to slow generations
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+GaugeCollector = Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimates a quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Process-wide latency histograms, counters and gauges."""
+
+    def __init__(self):
+        self.stages: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, Tuple[str, GaugeCollector]] = {}
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Records how long the block takes under `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, amount: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_gauge(self, name: str, help_text: str, collect: GaugeCollector):
+        """Registers a gauge whose labelled values are read at scrape time."""
+        self.gauges[name] = (help_text, collect)
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines: List[str] = [
+            "# HELP chatbot_stage_duration_seconds Time spent in each hot-path stage.",
+            "# TYPE chatbot_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.stages.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(
+                    f'chatbot_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(
+                f'chatbot_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}}'
+                f" {histogram.count}"
+            )
+            lines.append(
+                f'chatbot_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}'
+            )
+            lines.append(
+                f'chatbot_stage_duration_seconds_count{{stage="{stage}"}}'
+                f" {histogram.count}"
+            )
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE chatbot_{name} counter")
+            lines.append(f"chatbot_{name} {value}")
+
+        for name, (help_text, collect) in sorted(self.gauges.items()):
+            lines.append(f"# HELP chatbot_{name} {help_text}")
+            lines.append(f"# TYPE chatbot_{name} gauge")
+            for labels, value in collect():
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"chatbot_{name}{{{label_text}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """A short human-readable overview for the stats command."""
+        lines = [f"{'stage':<20} {'count':>7} {'p50 ms':>9} {'p99 ms':>9}"]
+        for stage, histogram in sorted(self.stages.items()):
+            lines.append(
+                f"{stage:<20} {histogram.count:>7} "
+                f"{histogram.quantile(0.5) * 1000:>9.1f} "
+                f"{histogram.quantile(0.99) * 1000:>9.1f}"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value:g}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+class MetricsServer:
+    """Serves `/metrics` for Prometheus scrapes on a local port."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=metrics.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,243 @@
+# utils/model_router.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    TypeVar,
+)
+
+import httpx
+
+from ..config.config import Config, LLMBackend
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+log = logging.getLogger("chatbot.llm")
+
+T = TypeVar("T")
+
+# Latency quantiles are only trusted once a backend has this many samples
+MIN_LATENCY_SAMPLES = 10
+# Client error statuses that still reflect the backend's state: timeouts,
+# conflicts and rate limits
+TRANSIENT_CLIENT_STATUSES = (408, 409, 429)
+
+
+def is_request_error(error: Exception) -> bool:
+    """Whether the backend rejected the request itself, e.g. a bad prompt.
+
+    Such errors say nothing about the backend's health.
+    """
+    status = getattr(error, "status_code", None)
+    return (
+        isinstance(status, int)
+        and 400 <= status < 500
+        and status not in TRANSIENT_CLIENT_STATUSES
+    )
+
+
+class Backend:
+    """One routed endpoint and model, with rolling latency and error stats."""
+
+    def __init__(self, spec: LLMBackend, api_key: str, window: int):
+        self.name = spec.name
+        self.model = spec.model
+        self.base_url = spec.base_url
+        self.api_key = spec.api_key or api_key
+        self.timeout = spec.timeout
+        self.client: Optional["AsyncOpenAI"] = None
+        # Recent latencies per request kind, e.g. full completions or first tokens
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.window = window
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.down_until = 0.0
+
+    def connect(self, http_client: httpx.AsyncClient) -> "AsyncOpenAI":
+        """Returns the API client, creating it on first use."""
+        if self.client is None:
+            from openai import AsyncOpenAI
+
+            self.client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url or None,
+                http_client=http_client,
+                max_retries=0,
+            )
+        return self.client
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def latency_quantile(self, kind: str, q: float) -> Optional[float]:
+        latencies = self.latencies.get(kind)
+        if not latencies or len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def record_success(self, kind: str, latency: float):
+        latencies = self.latencies.get(kind)
+        if latencies is None:
+            latencies = self.latencies[kind] = deque(maxlen=self.window)
+        latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_failure(self, max_error_rate: float, cooldown: float):
+        """Counts a failure, taking the backend out of rotation if it keeps failing.
+
+        A few failures are enough to trip a backend with little history.
+        """
+        self.outcomes.append(False)
+        if self.outcomes.count(False) >= 3 and self.error_rate >= max_error_rate:
+            self.down_until = time.monotonic() + cooldown
+            self.outcomes.clear()
+            metrics.inc("llm_backend_cooldowns_total")
+            log.warning("Backend %s is failing, skipped for %ss", self.name, cooldown)
+
+
+class ModelRouter:
+    """Routes requests across backends in order of preference.
+
+    Backends whose recent error rate is too high are skipped for a cooldown.
+    A failed request falls through to the next backend straight away, and
+    with hedging enabled a request that runs past the backend's usual
+    latency is raced against the next backend.
+    """
+
+    def __init__(
+        self, config: Config, specs: List[LLMBackend], http_client: httpx.AsyncClient
+    ):
+        self.config = config
+        self.http_client = http_client
+        self.backends = [
+            Backend(spec, config.OPENAI_API_KEY, config.LLM_BACKEND_WINDOW)
+            for spec in specs
+        ]
+        metrics.register_gauge(
+            "llm_backend_error_rate",
+            "Share of recent requests to each backend that failed.",
+            lambda: (({"backend": b.name}, b.error_rate) for b in self.backends),
+        )
+        metrics.register_gauge(
+            "llm_backend_healthy",
+            "Whether each backend is currently in rotation.",
+            lambda: (({"backend": b.name}, int(b.healthy)) for b in self.backends),
+        )
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def candidates(self) -> List[Backend]:
+        """Healthy backends in order, then the others by soonest recovery."""
+        healthy = [backend for backend in self.backends if backend.healthy]
+        cooling = sorted(
+            (backend for backend in self.backends if not backend.healthy),
+            key=lambda backend: backend.down_until,
+        )
+        return healthy + cooling
+
+    async def attempt(
+        self, backend: Backend, kind: str, request: Callable[[Backend], Awaitable[T]]
+    ) -> T:
+        start = time.perf_counter()
+        try:
+            result = await request(backend)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if not is_request_error(e):
+                backend.record_failure(
+                    self.config.LLM_BACKEND_MAX_ERROR_RATE,
+                    self.config.LLM_BACKEND_COOLDOWN,
+                )
+            raise
+        latency = time.perf_counter() - start
+        backend.record_success(kind, latency)
+        metrics.observe(f"llm_{kind}_{backend.name}", latency)
+        return result
+
+    async def run(
+        self,
+        kind: str,
+        request: Callable[[Backend], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> T:
+        """Runs `request` against the best backend, falling back on failure.
+
+        When a hedged request succeeds on both backends, the result not
+        returned is passed to `discard`, e.g. to close its stream. Raises
+        the last error if every backend failed.
+        """
+        backends = self.candidates()
+        last_error: Optional[BaseException] = None
+        attempts: Dict["asyncio.Task[T]", Backend] = {}
+        next_index = 0
+        try:
+            while next_index < len(backends) or attempts:
+                if not attempts:
+                    backend = backends[next_index]
+                    next_index += 1
+                    task = asyncio.create_task(self.attempt(backend, kind, request))
+                    attempts[task] = backend
+
+                # Hedge once the request is slower than usual for its backend
+                hedge_after = None
+                if (
+                    self.config.LLM_HEDGE
+                    and len(attempts) == 1
+                    and next_index < len(backends)
+                ):
+                    (only,) = attempts.values()
+                    hedge_after = only.latency_quantile(
+                        kind, self.config.LLM_HEDGE_QUANTILE
+                    )
+
+                done, _ = await asyncio.wait(
+                    attempts, timeout=hedge_after, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    backend = backends[next_index]
+                    next_index += 1
+                    metrics.inc("llm_hedged_total")
+                    task = asyncio.create_task(self.attempt(backend, kind, request))
+                    attempts[task] = backend
+                    continue
+
+                for task in done:
+                    backend = attempts.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    last_error = error
+                    log.warning("Backend %s failed: %s", backend.name, error)
+        finally:
+            # Cancel the losing side of a hedge, or everything if we were cancelled
+            for task in attempts:
+                task.cancel()
+            if attempts:
+                results = await asyncio.gather(*attempts, return_exceptions=True)
+                # Attempts that finished before they could be cancelled
+                for result in results:
+                    if discard is not None and not isinstance(result, BaseException):
+                        await discard(result)
+
+        assert last_error is not None
+        raise last_error
@@ -1,29 +1,312 @@
 # utils/openai_client.py
+import asyncio
+import importlib
+import logging
+import random
 import time
-from typing import Dict, List
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
 
-from openai import OpenAI
+import httpx
 
-from ..config.config import Config
+from ..config.config import Config, LLMBackend
+from .llm_limiter import PRIORITY_MENTION, LLMLimiter
+from .metrics import metrics
+from .model_router import Backend, ModelRouter
+
+# The OpenAI SDK takes a large share of startup to import, so it is loaded
+# on a worker thread during setup (see `OpenAIClient.warm_up`) or on first use.
+if TYPE_CHECKING:
+    from openai import AsyncStream
+    from openai.types import CompletionUsage
+    from openai.types.chat import ChatCompletionChunk
+
+log = logging.getLogger("chatbot.llm")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+DEFAULT_RESPONSE = "Sorry I am kinda sleepy right now, can you ask me later?"
+
+def retryable_errors() -> Tuple[type, ...]:
+    """Errors worth retrying; anything else (bad request, auth) fails at once."""
+    import openai
+
+    return (
+        openai.APIConnectionError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+    )
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Returns the server's requested retry delay in seconds, if any."""
+    from openai import APIStatusError
+
+    if not isinstance(error, APIStatusError):
+        return None
+
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                retry_at = parsedate_to_datetime(value)
+                return (retry_at - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backend_specs(config: Config) -> List[LLMBackend]:
+    """Returns the configured backends, or one built from the basic settings."""
+    if config.LLM_BACKENDS:
+        return config.LLM_BACKENDS
+    return [
+        LLMBackend(
+            name="local" if config.LOCAL_CLIENT_URL else "openai",
+            model=config.MODEL_NAME or DEFAULT_MODEL,
+            base_url=config.LOCAL_CLIENT_URL,
+            timeout=config.LLM_TIMEOUT,
+        )
+    ]
 
 
 class OpenAIClient:
     def __init__(self, config: Config):
-        base_url = config.LOCAL_CLIENT_URL if config.LOCAL_CLIENT_URL else None
-        self.client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=base_url)
+        self.config = config
 
-    def send_message(self, messages: List[Dict[str, str]]) -> str:
-        default_response = "Sorry I am kinda sleepy right now, can you ask me later?"
+        # One pooled HTTP client shared by every channel, so concurrent
+        # completions reuse connections instead of opening new ones.
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(config.LLM_TIMEOUT),
+        )
+        self.router = ModelRouter(config, backend_specs(config), self.http_client)
+        self.limiter = LLMLimiter(
+            config.LLM_MAX_IN_FLIGHT,
+            config.LLM_MAX_QUEUE,
+            config.LLM_RATE_LIMIT,
+            config.LLM_RATE_BURST,
+        )
 
-        for _ in range(3):
-            try:
-                response = self.client.chat.completions.create(
-                    model="gpt-4o-mini", messages=messages
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"Error: {e}")
-                time.sleep(3)
-                continue
-
-        return default_response
+    async def warm_up(self):
+        """Imports the SDK on a worker thread so first use doesn't pay for it."""
+        await asyncio.to_thread(importlib.import_module, "openai")
+
+    def extra_body(self, backend: Backend) -> Optional[Dict[str, bool]]:
+        # Local servers such as llama.cpp only reuse their KV cache when asked
+        if self.config.PROMPT_CACHE_HINTS and backend.base_url:
+            return {"cache_prompt": True}
+        return None
+
+    async def complete(self, backend: Backend, messages: List[Dict[str, str]]) -> str:
+        response = await backend.connect(self.http_client).chat.completions.create(
+            model=backend.model,
+            messages=messages,
+            timeout=backend.timeout,
+            extra_body=self.extra_body(backend),
+        )
+        self.report_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def open_stream(
+        self, backend: Backend, messages: List[Dict[str, str]]
+    ) -> Tuple["AsyncStream[ChatCompletionChunk]", List["ChatCompletionChunk"]]:
+        """Starts a stream and reads it up to the first chunk with text.
+
+        Returns the stream, positioned after that chunk, and the chunks read
+        so far.
+        """
+        stream = await backend.connect(self.http_client).chat.completions.create(
+            model=backend.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=backend.timeout,
+            extra_body=self.extra_body(backend),
+        )
+        chunks: List["ChatCompletionChunk"] = []
+        try:
+            while True:
+                chunk = await stream.__anext__()
+                chunks.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except StopAsyncIteration:
+            pass
+        except BaseException:
+            # Also reached when a hedged stream loses the race
+            await stream.close()
+            raise
+        return stream, chunks
+
+    @staticmethod
+    async def close_stream(
+        opened: Tuple["AsyncStream[ChatCompletionChunk]", List["ChatCompletionChunk"]],
+    ):
+        """Releases the connection of a stream that won't be read."""
+        stream, _ = opened
+        await stream.close()
+
+    async def send_message(
+        self, messages: List[Dict[str, str]], priority: int = PRIORITY_MENTION
+    ) -> str:
+        queued_at = time.perf_counter()
+        async with self.limiter.slot(priority) as admitted:
+            metrics.observe("llm_queue_wait", time.perf_counter() - queued_at)
+            if not admitted:
+                log.warning("LLM queue is full, shedding request")
+                metrics.inc("llm_shed_total")
+                return DEFAULT_RESPONSE
+
+            with metrics.time("llm_generation"):
+                for attempt in range(self.config.LLM_MAX_RETRIES):
+                    await self.limiter.pace()
+                    try:
+                        return await self.router.run(
+                            "completion",
+                            lambda backend: self.complete(backend, messages),
+                        )
+                    except retryable_errors() as e:
+                        log.warning("LLM request failed: %s", e)
+                        metrics.inc("llm_errors_total")
+                        if attempt + 1 < self.config.LLM_MAX_RETRIES:
+                            delay = self.retry_delay(e, attempt)
+                            if delay is None:
+                                break
+                            metrics.inc("llm_retries_total")
+                            await asyncio.sleep(delay)
+                    except Exception as e:
+                        log.error("LLM request failed: %s", e)
+                        metrics.inc("llm_errors_total")
+                        break
+
+        return DEFAULT_RESPONSE
+
+    async def stream_message(
+        self, messages: List[Dict[str, str]], priority: int = PRIORITY_MENTION
+    ) -> AsyncIterator[str]:
+        """Yields completion text deltas as they arrive from the model."""
+        queued_at = time.perf_counter()
+        async with self.limiter.slot(priority) as admitted:
+            metrics.observe("llm_queue_wait", time.perf_counter() - queued_at)
+            if not admitted:
+                log.warning("LLM queue is full, shedding request")
+                metrics.inc("llm_shed_total")
+                yield DEFAULT_RESPONSE
+                return
+
+            started = False
+            generation_start = time.perf_counter()
+            for attempt in range(self.config.LLM_MAX_RETRIES):
+                await self.limiter.pace()
+                try:
+                    # Backends race (when hedging) and fail over up to the
+                    # first token; after that the stream is committed.
+                    stream, chunks = await self.router.run(
+                        "first_token",
+                        lambda backend: self.open_stream(backend, messages),
+                        self.close_stream,
+                    )
+                    # Only time spent waiting on the model counts, not the
+                    # time the consumer takes to post each delta
+                    upstream = time.perf_counter() - generation_start
+                    metrics.observe("llm_first_token", upstream)
+                    started = True
+                    for chunk in chunks:
+                        delta = self.chunk_text(chunk)
+                        if delta:
+                            yield delta
+                    while True:
+                        waiting_since = time.perf_counter()
+                        try:
+                            chunk = await stream.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        finally:
+                            upstream += time.perf_counter() - waiting_since
+                        delta = self.chunk_text(chunk)
+                        if delta:
+                            yield delta
+                    metrics.observe("llm_generation", upstream)
+                    return
+                except Exception as e:
+                    log.warning("LLM stream failed: %s", e)
+                    metrics.inc("llm_errors_total")
+                    # Text already shown to the user cannot be retracted, so only
+                    # retry when the failure happened before the first token.
+                    if started or not isinstance(e, retryable_errors()):
+                        break
+                    if attempt + 1 < self.config.LLM_MAX_RETRIES:
+                        delay = self.retry_delay(e, attempt)
+                        if delay is None:
+                            break
+                        metrics.inc("llm_retries_total")
+                        await asyncio.sleep(delay)
+
+            if not started:
+                yield DEFAULT_RESPONSE
+
+    def chunk_text(self, chunk: "ChatCompletionChunk") -> Optional[str]:
+        """Reports usage carried by a stream chunk and returns its text."""
+        if chunk.usage:
+            self.report_usage(chunk.usage)
+        if not chunk.choices:
+            return None
+        return chunk.choices[0].delta.content
+
+    @staticmethod
+    def report_usage(usage: Optional["CompletionUsage"]):
+        """Logs and counts the token usage reported by the server."""
+        if not usage:
+            return
+        details = usage.prompt_tokens_details
+        cached_tokens = (details.cached_tokens if details else None) or 0
+        metrics.inc("llm_prompt_tokens_total", usage.prompt_tokens)
+        metrics.inc("llm_cached_prompt_tokens_total", cached_tokens)
+        metrics.inc("llm_completion_tokens_total", usage.completion_tokens)
+        log.info(
+            "Usage: %d prompt tokens (%d cached), %d completion tokens",
+            usage.prompt_tokens,
+            cached_tokens,
+            usage.completion_tokens,
+            extra={
+                "prompt_tokens": usage.prompt_tokens,
+                "cached_prompt_tokens": cached_tokens,
+                "completion_tokens": usage.completion_tokens,
+            },
+        )
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Honours Retry-After when the server sends it, else backs off.
+
+        Returns None when the server asks to wait longer than
+        LLM_RETRY_MAX_DELAY, since the wait holds an admission slot.
+        """
+        delay = retry_after(error)
+        if delay is None:
+            return self.backoff_delay(attempt)
+        if delay > self.config.LLM_RETRY_MAX_DELAY:
+            log.warning("Giving up: server asked to retry in %.0fs", delay)
+            metrics.inc("llm_retry_after_exceeded_total")
+            return None
+        return max(0.0, delay)
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Returns a jittered exponential backoff delay for the given attempt."""
+        delay = min(
+            self.config.LLM_RETRY_MAX_DELAY,
+            self.config.LLM_RETRY_BASE_DELAY * (2**attempt),
+        )
+        return random.uniform(0, delay)
+
+    async def close(self):
+        """Closes the pooled HTTP connections."""
+        await self.http_client.aclose()
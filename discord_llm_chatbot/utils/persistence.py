@@ -0,0 +1,331 @@
+# utils/persistence.py
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Set, TypeVar
+
+if TYPE_CHECKING:
+    from ..bot.conversation_store import CachedMessage
+
+log = logging.getLogger("chatbot.history")
+
+T = TypeVar("T")
+
+
+class PersistenceBackend(ABC):
+    """Interface for storing conversation history outside the process.
+
+    Write methods must return immediately; implementations are expected to
+    batch and apply them in the background so the event loop never waits
+    on disk.
+    """
+
+    def start(self):
+        """Starts any background workers."""
+
+    @abstractmethod
+    async def load_channel(self, channel_id: int) -> List["CachedMessage"]:
+        """Returns the persisted history for a channel, oldest first."""
+
+    @abstractmethod
+    def append(self, channel_id: int, message: "CachedMessage"):
+        """Records a new message at the end of a channel's history."""
+
+    @abstractmethod
+    def evict(self, channel_id: int, seq: int):
+        """Forgets every message in a channel up to and including `seq`."""
+
+    @abstractmethod
+    def update_images(self, channel_id: int, seq: int, image_urls: List[str]):
+        """Replaces the image URLs stored for a message."""
+
+    async def load_summary(self, channel_id: int) -> str:
+        """Returns the persisted summary of a channel's evicted history."""
+        return ""
+
+    def save_summary(self, channel_id: int, summary: str):
+        """Replaces the summary of a channel's evicted history."""
+
+    @abstractmethod
+    def clear(self, channel_id: int):
+        """Forgets a channel's whole history, including its summary."""
+
+    async def claim_reply(self, message_id: int) -> bool:
+        """Records that this process answers a message.
+
+        Returns False if another process sharing the backend already claimed
+        it, so a message seen by two shard workers is answered only once.
+        """
+        return True
+
+    async def close(self):
+        """Flushes pending writes and releases resources."""
+
+
+class SQLitePersistence(PersistenceBackend):
+    """SQLite (WAL) backend with a batched write-behind thread."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS messages (
+            channel_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            author_id INTEGER NOT NULL,
+            author_name TEXT NOT NULL,
+            content TEXT NOT NULL,
+            reply_to_id INTEGER,
+            image_urls TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'user',
+            PRIMARY KEY (channel_id, seq)
+        )
+    """
+
+    REPLIES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS replies (
+            message_id INTEGER PRIMARY KEY,
+            claimed_at REAL NOT NULL
+        )
+    """
+
+    SUMMARIES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries (
+            channel_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL
+        )
+    """
+
+    # Claims only need to outlive the window in which a duplicate could arrive
+    CLAIM_RETENTION = 24 * 60 * 60
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        read_timeout: float = 30.0,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.read_timeout = read_timeout
+        self.queue: "queue.Queue[Optional[Callable[[sqlite3.Connection], None]]]" = (
+            queue.Queue()
+        )
+        self.thread: Optional[threading.Thread] = None
+        # Reads waiting on the writer thread, failed if it stops
+        self.reads: "Set[Future[Any]]" = set()
+        self.reads_lock = threading.Lock()
+        self.stopped = False
+
+    def start(self):
+        if self.thread is None:
+            self.stopped = False
+            self.thread = threading.Thread(
+                target=self.run, name="history-writer", daemon=True
+            )
+            self.thread.start()
+
+    def run(self):
+        try:
+            self.write_loop()
+        except Exception as e:
+            log.exception("History writer stopped: %s", e)
+        finally:
+            with self.reads_lock:
+                self.stopped = True
+                reads, self.reads = self.reads, set()
+            for future in reads:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(RuntimeError("History writer stopped"))
+
+    def write_loop(self):
+        """Applies queued operations in batched transactions."""
+        # Shard workers in other processes may hold the write lock briefly
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(self.SCHEMA)
+        conn.execute(self.REPLIES_SCHEMA)
+        conn.execute(self.SUMMARIES_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+        if "role" not in columns:
+            conn.execute(
+                "ALTER TABLE messages ADD COLUMN role TEXT NOT NULL DEFAULT 'user'"
+            )
+        conn.commit()
+
+        running = True
+        while running:
+            try:
+                ops = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(ops) < self.batch_size:
+                try:
+                    ops.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with conn:
+                for op in ops:
+                    if op is None:
+                        running = False
+                        break
+                    try:
+                        op(conn)
+                    except Exception as e:
+                        log.exception("Error writing conversation history: %s", e)
+
+        conn.close()
+
+    def submit(self, op: Callable[[sqlite3.Connection], None]):
+        self.queue.put_nowait(op)
+
+    async def read(self, query: Callable[[sqlite3.Connection], T]) -> T:
+        """Runs a query on the writer thread and returns its result.
+
+        Reads go through the writer thread so they observe every write
+        queued before them.
+        """
+        future: "Future[T]" = Future()
+
+        def run(conn: sqlite3.Connection):
+            # Skips reads that timed out while queued
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(query(conn))
+            except Exception as e:
+                future.set_exception(e)
+
+        with self.reads_lock:
+            if self.thread is None or self.stopped:
+                raise RuntimeError("History writer is not running")
+            self.reads.add(future)
+        future.add_done_callback(self.reads.discard)
+        self.submit(run)
+        return await asyncio.wait_for(asyncio.wrap_future(future), self.read_timeout)
+
+    async def load_channel(self, channel_id: int) -> List["CachedMessage"]:
+        from ..bot.conversation_store import CachedMessage
+
+        rows = await self.read(
+            lambda conn: conn.execute(
+                "SELECT seq, created_at, author_id, author_name, content,"
+                " reply_to_id, image_urls, role FROM messages"
+                " WHERE channel_id = ? ORDER BY seq",
+                (channel_id,),
+            ).fetchall()
+        )
+        return [
+            CachedMessage(
+                datetime.fromisoformat(created_at),
+                author_id,
+                author_name,
+                content,
+                reply_to_id,
+                json.loads(image_urls),
+                role,
+                seq,
+            )
+            for (
+                seq,
+                created_at,
+                author_id,
+                author_name,
+                content,
+                reply_to_id,
+                image_urls,
+                role,
+            ) in rows
+        ]
+
+    def append(self, channel_id: int, message: "CachedMessage"):
+        row = (
+            channel_id,
+            message.seq,
+            message.created_at.isoformat(),
+            message.author_id,
+            message.author_name,
+            message.content,
+            message.reply_to_id,
+            json.dumps(message.image_urls),
+            message.role,
+        )
+        self.submit(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+        )
+
+    def evict(self, channel_id: int, seq: int):
+        self.submit(
+            lambda conn: conn.execute(
+                "DELETE FROM messages WHERE channel_id = ? AND seq <= ?",
+                (channel_id, seq),
+            )
+        )
+
+    def update_images(self, channel_id: int, seq: int, image_urls: List[str]):
+        urls = json.dumps(image_urls)
+        self.submit(
+            lambda conn: conn.execute(
+                "UPDATE messages SET image_urls = ? WHERE channel_id = ? AND seq = ?",
+                (urls, channel_id, seq),
+            )
+        )
+
+    async def load_summary(self, channel_id: int) -> str:
+        row = await self.read(
+            lambda conn: conn.execute(
+                "SELECT summary FROM summaries WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        )
+        return row[0] if row else ""
+
+    def save_summary(self, channel_id: int, summary: str):
+        self.submit(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?)",
+                (channel_id, summary),
+            )
+        )
+
+    def clear(self, channel_id: int):
+        def clear(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+            conn.execute("DELETE FROM summaries WHERE channel_id = ?", (channel_id,))
+
+        self.submit(clear)
+
+    async def claim_reply(self, message_id: int) -> bool:
+        inserted = await self.read(
+            lambda conn: conn.execute(
+                "INSERT OR IGNORE INTO replies VALUES (?, ?)",
+                (message_id, time.time()),
+            ).rowcount
+        )
+        return inserted == 1
+
+    async def prune_claims(self):
+        """Forgets reply claims older than CLAIM_RETENTION."""
+        cutoff = time.time() - self.CLAIM_RETENTION
+        self.submit(
+            lambda conn: conn.execute(
+                "DELETE FROM replies WHERE claimed_at < ?", (cutoff,)
+            )
+        )
+
+    async def close(self):
+        if self.thread is not None:
+            self.queue.put_nowait(None)
+            await asyncio.to_thread(self.thread.join)
+            self.thread = None
@@ -0,0 +1,70 @@
+# utils/tokenizer.py
+import logging
+import re
+from typing import Any, Callable, Dict, List
+
+log = logging.getLogger("chatbot.llm")
+
+# Approximate framing cost of each chat message and of priming the reply,
+# following OpenAI's published counting rules for chat models.
+MESSAGE_OVERHEAD = 3
+REPLY_PRIMING = 3
+
+# Fallback when tiktoken is unavailable: words split into 4-character
+# pieces, with each punctuation mark counted on its own.
+ESTIMATE_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates the token count of text without a tokenizer."""
+    return len(ESTIMATE_PATTERN.findall(text))
+
+
+def load_text_counter(model: str) -> Callable[[str], int]:
+    """Returns an offline token counter for the model's encoding."""
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # The encoding is downloaded on first use, which fails offline
+        log.warning("Could not load the tokenizer, estimating tokens: %s", e)
+        return estimate_tokens
+    return lambda text: len(encoding.encode_ordinary(text))
+
+
+class TokenCounter:
+    """Counts prompt tokens for chat messages, including image parts."""
+
+    def __init__(self, model: str, image_tokens: int):
+        self.image_tokens = image_tokens
+        self.count_text_tokens = load_text_counter(model)
+
+    def count_text(self, text: str) -> int:
+        return self.count_text_tokens(text) if text else 0
+
+    def count_content(self, content: Any) -> int:
+        """Counts a message's content, given as a string or content parts."""
+        if isinstance(content, str):
+            return self.count_text(content)
+
+        tokens = 0
+        for part in content:
+            if part["type"] == "text":
+                tokens += self.count_text(part["text"])
+            elif part["type"] == "image_url":
+                tokens += self.image_tokens
+        return tokens
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return MESSAGE_OVERHEAD + self.count_content(message["content"])
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """Counts the prompt tokens of a whole chat completion request."""
+        return REPLY_PRIMING + sum(self.count_message(m) for m in messages)
@@ -0,0 +1,105 @@
+# utils/traffic_recorder.py
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import IO, Any, Dict, Iterable, List, Optional
+
+from discord.message import Message
+
+log = logging.getLogger("chatbot")
+
+# Stands in for the bot's own mention in recorded text
+BOT_MENTION = "<@bot>"
+# Words that change how the bot reacts, kept when text is masked
+KEPT_WORDS = ("chubmeter", "chugmeter", "uwu")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class TrafficRecorder:
+    """Appends sanitised incoming messages to a JSONL file for later replay.
+
+    Only what drives the bot's behaviour is kept: timing, pseudonymous IDs,
+    mentions, replies and attachment metadata. Text is masked word by word,
+    keeping its shape (and so roughly its token count), punctuation and the
+    words the bot reacts to. IDs are hashed with a salt that is never saved,
+    so they can't be traced back; pass the same salt to keep pseudonyms
+    stable across restarts and shard workers.
+
+    Entries are buffered in memory and written by `flush`, which runs on a
+    worker thread, so recording never waits on disk.
+    """
+
+    def __init__(self, path: str, keep: Iterable[str] = (), salt: str = ""):
+        self.salt = salt.encode() if salt else os.urandom(16)
+        self.keep = {word.lower() for word in (*KEPT_WORDS, *keep)}
+        self.file: Optional[IO[str]] = open(path, "a", encoding="utf-8")
+        self.lines: List[str] = []
+
+    def pseudonym(self, value: int) -> int:
+        digest = hashlib.sha256(self.salt + str(value).encode()).digest()
+        return int.from_bytes(digest[:7], "big")
+
+    def mask(self, text: str) -> str:
+        return WORD_PATTERN.sub(
+            lambda match: (
+                match.group(0)
+                if match.group(0).lower() in self.keep
+                else "x" * len(match.group(0))
+            ),
+            text,
+        )
+
+    def record(self, message: Message, bot_id: int, designated: bool):
+        """Writes one incoming message."""
+        if self.file is None:
+            return
+        resolved = message.reference.resolved if message.reference else None
+        entry: Dict[str, Any] = {
+            "time": message.created_at.timestamp(),
+            "id": self.pseudonym(message.id),
+            "channel": self.pseudonym(message.channel.id),
+            "designated": designated,
+            "author": self.pseudonym(message.author.id),
+            "author_bot": message.author.bot,
+            "content": BOT_MENTION.join(
+                self.mask(part)
+                for part in message.content.replace(
+                    f"<@!{bot_id}>", f"<@{bot_id}>"
+                ).split(f"<@{bot_id}>")
+            ),
+            "mentions_bot": any(user.id == bot_id for user in message.mentions),
+            "reply_to": self.pseudonym(resolved.id) if resolved else None,
+            "attachments": [
+                {
+                    "content_type": attachment.content_type,
+                    "size": attachment.size,
+                    "width": attachment.width,
+                    "height": attachment.height,
+                }
+                for attachment in message.attachments
+            ],
+        }
+        self.lines.append(json.dumps(entry) + "\n")
+
+    async def flush(self):
+        """Writes the buffered entries to the file."""
+        lines, self.lines = self.lines, []
+        if lines and self.file is not None:
+            await asyncio.to_thread(self.write, self.file, lines)
+
+    def write(self, file: IO[str], lines: List[str]):
+        try:
+            file.writelines(lines)
+            file.flush()
+        except (OSError, ValueError) as e:
+            log.warning("Error recording traffic: %s", e)
+
+    def close(self):
+        if self.file is not None:
+            self.write(self.file, self.lines)
+            self.lines = []
+            self.file.close()
+            self.file = None
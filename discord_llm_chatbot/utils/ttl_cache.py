@@ -0,0 +1,45 @@
+# utils/ttl_cache.py
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """A bounded LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Returns the cached value, or None if it is missing or expired."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def purge_expired(self) -> int:
+        """Drops every expired entry, returning how many were removed."""
+        now = time.monotonic()
+        expired = [key for key, (expires, _) in self.entries.items() if expires < now]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
+
+    def set(self, key: Hashable, value: V):
+        """Stores a value, evicting the least recently used entry if full."""
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
@@ -0,0 +1,102 @@
+# tests/test_model_router.py
+import asyncio
+from typing import List
+
+import httpx
+import pytest
+
+from discord_llm_chatbot.config.config import Config, LLMBackend
+from discord_llm_chatbot.utils.model_router import ModelRouter, is_request_error
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def make_router(**overrides) -> ModelRouter:
+    settings = dict(
+        DISCORD_TOKEN="",
+        OPENAI_API_KEY="test",
+        DESIGNATED_CHANNELS=[],
+        GUILD_TEST_ID="",
+        OWNER_ID="",
+        LOCAL_CLIENT_URL="",
+        MODEL_NAME="",
+    )
+    settings.update(overrides)
+    specs = [LLMBackend("primary", "a"), LLMBackend("fallback", "b")]
+    return ModelRouter(Config(**settings), specs, httpx.AsyncClient())
+
+
+@pytest.mark.parametrize(
+    "status, expected", [(400, True), (404, True), (429, False), (500, False)]
+)
+def test_request_errors(status, expected):
+    assert is_request_error(StatusError(status)) == expected
+    assert not is_request_error(RuntimeError("connection reset"))
+
+
+def test_rejected_requests_do_not_trip_the_backend():
+    async def run():
+        router = make_router()
+
+        async def request(backend):
+            raise StatusError(400)
+
+        for _ in range(5):
+            with pytest.raises(StatusError):
+                await router.run("completion", request)
+        assert all(backend.healthy for backend in router.backends)
+        assert router.primary.error_rate == 0.0
+
+    asyncio.run(run())
+
+
+def test_failing_backend_is_skipped():
+    async def run():
+        router = make_router()
+
+        async def request(backend):
+            if backend.name == "primary":
+                raise StatusError(500)
+            return backend.name
+
+        for _ in range(3):
+            assert await router.run("completion", request) == "fallback"
+        assert not router.primary.healthy
+        assert router.candidates()[0].name == "fallback"
+
+    asyncio.run(run())
+
+
+def test_hedge_result_that_is_not_returned_is_discarded():
+    async def run():
+        router = make_router(LLM_HEDGE=True)
+        # Both backends take the same time, so the hedge finishes together
+        # with the primary
+        for backend in router.backends:
+            for _ in range(10):
+                backend.record_success("completion", 0.0)
+        release = asyncio.Event()
+
+        async def request(backend):
+            await release.wait()
+            return backend.name
+
+        async def open_requests():
+            await asyncio.sleep(0.01)
+            release.set()
+
+        discarded: List[str] = []
+
+        async def discard(result):
+            discarded.append(result)
+
+        asyncio.create_task(open_requests())
+        result = await router.run("completion", request, discard)
+        assert {result, *discarded} == {"primary", "fallback"}
+        assert len(discarded) == 1
+
+    asyncio.run(run())
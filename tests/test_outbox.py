@@ -0,0 +1,106 @@
+# tests/test_outbox.py
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+from typing import List
+
+from discord_llm_chatbot.bot.outbox import (
+    FENCE_CLOSE,
+    OutgoingMessage,
+    Outbox,
+    split_message,
+)
+
+
+def test_short_text_is_one_chunk():
+    assert split_message("hello world", 20) == ["hello world"]
+
+
+def test_splits_at_the_best_boundary():
+    text = "first paragraph\n\nsecond line\nthird words here"
+    chunks = split_message(text, 30)
+    assert chunks == ["first paragraph", "second line\nthird words here"]
+    assert all(len(chunk) <= 30 for chunk in chunks)
+
+
+def test_never_exceeds_the_limit_without_boundaries():
+    chunks = split_message("x" * 100, 30)
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert "".join(chunks) == "x" * 100
+
+
+def test_reopens_a_code_block_with_its_language():
+    code = "\n".join(f"print({i})" for i in range(20))
+    text = f"Here you go:\n```python\n{code}\n```\nDone."
+    chunks = split_message(text, 80)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    assert chunks[0].endswith(FENCE_CLOSE)
+    for chunk in chunks[1:-1]:
+        assert chunk.startswith("```python\n")
+        assert chunk.endswith(FENCE_CLOSE)
+    assert chunks[-1].startswith("```python\n")
+    # Every chunk renders on its own, with balanced fences
+    assert all(chunk.count("```") % 2 == 0 for chunk in chunks)
+
+
+def test_closed_code_block_is_not_reopened():
+    text = "```\nshort\n```\n" + "word " * 30
+    chunks = split_message(text, 60)
+    assert chunks[0].startswith("```\nshort\n```")
+    assert not any(chunk.startswith("```") for chunk in chunks[1:])
+
+
+def test_drops_blank_chunks():
+    assert split_message("  \n\n  ", 3) == []
+
+
+def take_batch(limit: int, *items: dict) -> List[List[str]]:
+    """Runs take_batch until the queue is empty and returns each batch."""
+
+    async def run():
+        outbox = Outbox(None, limit)
+        channel = SimpleNamespace(id=1)
+        queue = deque(
+            OutgoingMessage(
+                channel,
+                item["content"],
+                item.get("reference"),
+                item.get("coalesce", True),
+            )
+            for item in items
+        )
+        batches = []
+        while queue:
+            batches.append([item.content for item in outbox.take_batch(queue)])
+        return batches
+
+    return asyncio.run(run())
+
+
+def test_coalesces_queued_messages():
+    assert take_batch(100, {"content": "a"}, {"content": "b"}, {"content": "c"}) == [
+        ["a", "b", "c"]
+    ]
+
+
+def test_batches_stay_within_the_limit():
+    # Joined with newlines: "aaaa\nbbbb" is 9 characters
+    batches = take_batch(
+        9, {"content": "aaaa"}, {"content": "bbbb"}, {"content": "cccc"}
+    )
+    assert batches == [["aaaa", "bbbb"], ["cccc"]]
+
+
+def test_does_not_coalesce_other_references_or_opted_out_messages():
+    reply = SimpleNamespace(id=42)
+    batches = take_batch(
+        100,
+        {"content": "a"},
+        {"content": "b", "reference": reply},
+        {"content": "c", "reference": reply},
+        {"content": "d", "coalesce": False},
+        {"content": "e"},
+    )
+    assert batches == [["a"], ["b", "c"], ["d"], ["e"]]
@@ -0,0 +1,47 @@
+# tests/test_streaming.py
+import asyncio
+from typing import List
+
+from discord_llm_chatbot.bot.streaming import StreamingReply
+from discord_llm_chatbot.utils.text_processor import FEED_BATCH
+
+
+class FakeMessage:
+    def __init__(self, content: str):
+        self.content = content
+
+    async def edit(self, content: str):
+        self.content = content
+
+    async def delete(self):
+        pass
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.sent: List[FakeMessage] = []
+
+    async def send(self, channel, content, reference=None, coalesce=True):
+        message = FakeMessage(content)
+        self.sent.append(message)
+        return [message]
+
+
+def test_short_reply_is_sent_before_the_stream_ends():
+    async def run():
+        outbox = FakeOutbox()
+        reply = StreamingReply(outbox, None, None, 2000, 20, 1.0, lambda text: text)
+        for char in "Sure, sounds great to me!":
+            await reply.feed(char)
+        assert [message.content for message in outbox.sent] == [
+            "Sure, sounds great to"
+        ]
+        # Later text is cleaned in batches
+        assert reply.cleaner.batch == FEED_BATCH
+
+        text, shown = reply.complete()
+        await reply.finish(shown)
+        assert text == "Sure, sounds great to me!"
+        assert outbox.sent[0].content == text
+
+    asyncio.run(run())
@@ -0,0 +1,164 @@
+# tests/test_text_processor.py
+import random
+from typing import List
+
+import pytest
+
+from discord_llm_chatbot.utils.text_processor import (
+    CLEANUP_PATTERN,
+    REPLY_TO_MARKER,
+    ResponseCleaner,
+    clean_response,
+    cleanup_matches,
+    parse_structured,
+    strip_artefacts,
+)
+
+STRUCTURED = (
+    "<|start|>\nauthor: Vivi\nmessage:  hi there, how's it going? "
+    "\nreply_to: null\n<|end|>"
+)
+PLAIN = (
+    "Replying to Bob: ignore this\nWell -sent by Vivi#5153: actually "
+    "it is fine #1234 (vivi: ok) done"
+)
+SAMPLES = [
+    STRUCTURED,
+    PLAIN,
+    "<|start|>\nauthor: Vivi\nmessage: \nreply_to: null\n<|end|>",
+    "<|start|>\nauthor: Vivi\nmessage: line one\n\nline two\nreply_to: x\n<|end|>",
+    "no artefacts here at all",
+    "",
+]
+
+
+def stream(text: str, sizes: List[int]) -> List[str]:
+    """Feeds `text` to a cleaner in deltas of `sizes`, cycled."""
+    cleaner = ResponseCleaner()
+    outputs = []
+    i = 0
+    while i < len(text):
+        size = sizes[len(outputs) % len(sizes)]
+        outputs.append(cleaner.feed(text[i : i + size]))
+        i += size
+    outputs.append(cleaner.finish())
+    assert cleaner.text == "".join(outputs)
+    return outputs
+
+
+def test_parse_structured():
+    assert parse_structured(STRUCTURED) == (
+        "Vivi",
+        " hi there, how's it going? ",
+        "null",
+    )
+    assert parse_structured(STRUCTURED.replace("\n<|end|>", "")) is None
+    assert parse_structured("plain text") is None
+
+
+@pytest.mark.parametrize("text", [PLAIN, "#12345 -vivi x (Vi Vi: y", "rReplying to"])
+def test_cleanup_matches_agree_with_the_pattern(text: str):
+    assert [m.span() for m in cleanup_matches(text)] == [
+        m.span() for m in CLEANUP_PATTERN.finditer(text)
+    ]
+    assert strip_artefacts(text) == CLEANUP_PATTERN.sub("", text)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+@pytest.mark.parametrize("sizes", [[1], [3], [7, 1, 2], [1000]])
+def test_streaming_matches_batch_cleanup(text: str, sizes: List[int]):
+    assert "".join(stream(text, sizes)) == clean_response(text)
+
+
+def test_holds_back_a_partial_reply_to_marker():
+    cleaner = ResponseCleaner()
+    head = "<|start|>\nauthor: Vivi\nmessage: hello"
+    # Long enough to be cleaned straight away
+    text = cleaner.feed(head + " there" * 20 + "\nreply_")
+    assert text.endswith("there")
+    assert "\n" not in text
+    # The newline belonged to the marker, so it is never emitted
+    assert cleaner.feed("to: null\n<|end|>") == ""
+    assert cleaner.finish() == ""
+    assert cleaner.text == clean_response(
+        head + " there" * 20 + "\nreply_to: null\n<|end|>"
+    )
+
+
+def test_partial_reply_to_marker_that_turns_out_to_be_text():
+    text = "<|start|>\nauthor: Vivi\nmessage: a\nreply_ish" + " b" * 40
+    text += REPLY_TO_MARKER + "null\n<|end|>"
+    assert "".join(stream(text, [1])) == "a\nreply_ish" + " b" * 40
+
+
+def test_cleanup_match_across_chunk_boundaries():
+    text = "x" * 100 + "-sent by Vivi#5153: hey " + "y" * 100 + " #1234"
+    for split in range(100, 125):
+        cleaner = ResponseCleaner()
+        out = cleaner.feed(text[:split]) + cleaner.feed(text[split:])
+        out += cleaner.finish()
+        assert out == "x" * 100 + "y" * 100 + " "
+
+
+def test_replying_to_line_split_across_chunks():
+    text = "a" * 80 + " Replying to Bob: secret stuff\n" + "b" * 80
+    outputs = stream(text, [5])
+    assert "secret" not in "".join(outputs)
+    assert "".join(outputs) == clean_response(text)
+
+
+def test_random_streams_match_batch_cleanup():
+    pieces = [
+        "<|start|>",
+        "\nauthor: ",
+        "\nmessage: ",
+        "\nreply_to: ",
+        "\n<|end|>",
+        "Vivi",
+        "- sent by Vi Vi#5153: ",
+        "Replying to x\n",
+        "#1234",
+        " hello",
+        "\n",
+        "(",
+        " ",
+        "lorem ipsum ",
+    ]
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 30)))
+        # Malformed structured responses are outside what streaming promises
+        if text.lstrip().startswith("<|start|>") != bool(parse_structured(text)):
+            continue
+        if parse_structured(text) and not text.lstrip().startswith(
+            "<|start|>\nauthor: "
+        ):
+            continue
+        sizes = [rng.randint(1, 20) for _ in range(5)]
+        assert "".join(stream(text, sizes)) == clean_response(text), text
+
+
+def test_short_plain_reply_is_emitted_before_finish():
+    reply = "Sure, sounds great!!"
+    cleaner = ResponseCleaner(batch=0)
+    emitted = "".join(cleaner.feed(char) for char in reply)
+    # Only the last character is held back: it could begin ".Replying to"
+    assert emitted == reply[:-1]
+    assert emitted + cleaner.finish() == reply
+
+
+def test_holds_back_only_what_more_text_could_match():
+    cleaner = ResponseCleaner(batch=0)
+    assert cleaner.feed("ok then, Repl") == "ok then,"
+    assert cleaner.feed("ying to Bob: hi") == ""
+    assert cleaner.feed("\nbye") == "\nby"
+    assert cleaner.finish() == "e"
+
+
+def test_overlapping_artefacts_are_removed_in_one_pass():
+    # Separate passes removed " Replying to x" first and left "-viv". In one
+    # pass the signature starts first and takes the next word with it, so
+    # "Replying to" no longer matches
+    assert clean_response("-vivi Replying to x") == "to x"
+    assert clean_response("x Replying to -vivi\nhi") == "x\nhi"
+    assert clean_response("hi -vivi: #1234 ok") == "hi ok"
@@ -0,0 +1,28 @@
+# tests/test_tokenizer.py
+import sys
+import types
+
+from discord_llm_chatbot.utils.tokenizer import estimate_tokens, load_text_counter
+
+
+def test_estimates_when_the_encoding_cannot_be_loaded(monkeypatch):
+    # tiktoken downloads encodings on first use, which fails offline
+    def download(*args):
+        raise OSError("network unreachable")
+
+    tiktoken = types.ModuleType("tiktoken")
+    tiktoken.encoding_for_model = download
+    tiktoken.get_encoding = download
+    monkeypatch.setitem(sys.modules, "tiktoken", tiktoken)
+
+    assert load_text_counter("gpt-4o-mini") is estimate_tokens
+
+
+def test_estimates_without_tiktoken(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    assert load_text_counter("gpt-4o-mini") is estimate_tokens
+
+
+def test_estimate_counts_word_pieces_and_punctuation():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("hello, world!") == 6
@@ -0,0 +1,111 @@
+# tests/test_triggers.py
+import re
+
+import pytest
+
+from discord_llm_chatbot.bot.triggers import TriggerEngine, compile_words, trie_pattern
+
+
+async def chub(message):
+    pass
+
+
+async def chug(message):
+    pass
+
+
+def matches(words, text):
+    pattern = compile_words(words)
+    return [match.group(0) for match in pattern.finditer(text)]
+
+
+def test_shared_prefixes_share_a_branch():
+    words = ["wh", "why", "what"]
+    pattern = trie_pattern(words)
+    # One branch for the shared "wh", instead of one alternative per word
+    literals = pattern.replace("\\w", "")
+    assert literals.count("w") == 1
+    assert literals.count("h") == 1
+    assert pattern.count("|") <= len(words) - 1
+    for word in words:
+        assert re.fullmatch(pattern, word)
+    assert not re.fullmatch(pattern, "w")
+
+
+def test_prefix_word_does_not_cut_a_longer_one_short():
+    assert matches(["wh", "why", "what"], "so what, wh, why") == ["what", "wh", "why"]
+
+
+@pytest.mark.parametrize(
+    "text, found",
+    [
+        ("vivi", True),
+        ("hey vivi!", True),
+        ("(vivi)", True),
+        ("vivian", False),
+        ("avivi", False),
+        ("_vivi", False),
+        ("1vivi", False),
+    ],
+)
+def test_keywords_only_match_whole_words(text, found):
+    assert bool(matches(["vivi"], text)) == found
+
+
+def test_lookbehind_keeps_a_literal_first():
+    # The start boundary follows the first character, so the pattern still
+    # opens with a literal the regex engine can scan for
+    pattern = trie_pattern(["vivi"])
+    assert pattern.startswith("v")
+    assert re.compile(pattern).search("vivi") is not None
+
+
+def test_non_word_keywords_match_anywhere():
+    assert matches(["?"], "why?is") == ["?"]
+    assert matches(["hi?"], "ohhi? hi?") == ["hi?"]
+
+
+def test_special_characters_are_escaped():
+    assert matches(["c++", "a.b"], "c++ axb a.b") == ["c++", "a.b"]
+
+
+def test_no_words_compile_to_none():
+    assert compile_words([]) is None
+    assert compile_words([""]) is None
+
+
+def make_engine(**kwargs) -> TriggerEngine:
+    options = {
+        "commands": {"!chubmeter": chub, "!chugmeter": chug},
+        "keywords": ["Vivi", "why"],
+        "channel_keywords": {2: ["bot"]},
+        "designated_channels": [1, 2],
+    }
+    options.update(kwargs)
+    return TriggerEngine(**options)
+
+
+def test_commands_match_at_the_start_only():
+    engine = make_engine()
+    assert engine.command("!chubmeter") is chub
+    assert engine.command("!chugmeter @someone") is chug
+    assert engine.command("!chubmeters") is None
+    assert engine.command("try !chubmeter") is None
+
+
+def test_keywords_are_case_insensitive_and_per_channel():
+    engine = make_engine()
+    assert engine.has_keyword(1, "hey VIVI")
+    assert not engine.has_keyword(1, "hey bot")
+    # Channel keywords replace the defaults
+    assert engine.has_keyword(2, "hey Bot")
+    assert not engine.has_keyword(2, "hey vivi")
+    assert engine.keywords == {"vivi", "why", "bot"}
+
+
+def test_without_triggers_nothing_matches():
+    engine = make_engine(commands={}, keywords=[], channel_keywords={})
+    assert engine.command("!chubmeter") is None
+    assert not engine.has_keyword(1, "anything")
+    assert engine.is_designated(1)
+    assert not engine.is_designated(3)